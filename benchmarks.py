@@ -0,0 +1,296 @@
+import json
+import platform
+import time
+import numpy as np
+import kernels
+from dynamic_systems import MultiPendulum, MultiPendulumEnsemble
+from energytracker import EnergyTracker
+from solvers import solver_name_to_class, DormandPrince45, RK4
+from trajectorytracker import TrajectoryTracker
+
+DEFAULT_SIZES = [1, 2, 4, 16, 64]
+DEFAULT_ENSEMBLE_SIZES = [1, 16, 256, 1024]
+WORK_PRECISION_STEPS = [0.04, 0.02, 0.01, 0.005, 0.0025]
+WORK_PRECISION_TOLERANCES = [1e-3, 1e-5, 1e-7, 1e-9]
+
+RECURSIVE_SIZES = [16, 64, 256, 1024, 4096]
+CONSISTENCY_SIZES = [1, 2, 3, 4, 8, 16, 32]
+
+def build_chain(N, backend="numpy", dynamics="dense"):
+    return MultiPendulum(
+        thetas=list(np.linspace(-1.5, -1.0, N)),
+        thetadots=[0.0]*N,
+        rod_lengths=list(np.linspace(100, 12, N)),
+        masses=[1.0]*N,
+        position=[600.0, 300.0],
+        backend=backend,
+        dynamics=dynamics
+    )
+
+def time_call(func, min_time=0.2, repeats=3):
+    # Best of `repeats` runs, each calling func until min_time has passed; returns seconds per call.
+    best = np.inf
+    for _ in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            func()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / calls)
+    return best
+
+def get_backends():
+    return ["numpy", "numba"] if kernels.numba_available() else ["numpy"]
+
+def benchmark_system(sizes, min_time):
+    results = []
+    for backend in get_backends():
+        for N in sizes:
+            system = build_chain(N, backend)
+            state = system.get_state()
+            system.derivative_func(0, state)
+
+            results.append({"name": "derivative_func", "N": N, "M": 1, "backend": backend,
+                            "seconds_per_call": time_call(lambda: system.derivative_func(0, state), min_time)})
+            results.append({"name": "get_total_energy", "N": N, "M": 1, "backend": backend,
+                            "seconds_per_call": time_call(system.get_total_energy, min_time)})
+    return results
+
+def benchmark_recursive(sizes, min_time):
+    results = []
+    for backend in get_backends():
+        for N in sizes:
+            system = build_chain(N, backend, "recursive")
+            state = system.get_state()
+            system.derivative_func(0, state)
+            results.append({"name": "derivative_func(recursive)", "N": N, "M": 1, "backend": backend,
+                            "seconds_per_call": time_call(lambda: system.derivative_func(0, state), min_time)})
+    return results
+
+def check_recursive_dynamics(sizes=None, samples=20, seed=0):
+    # Largest difference between the recursive and dense accelerations over random states, relative to their size.
+    sizes = CONSISTENCY_SIZES if sizes is None else sizes
+    rng = np.random.default_rng(seed)
+    results = []
+    for N in sizes:
+        rod_lengths = list(rng.uniform(0.5, 2.0, N))
+        masses = list(rng.uniform(0.5, 2.0, N))
+        dense = MultiPendulum([0.0]*N, [0.0]*N, rod_lengths, masses, [0.0, 0.0], damping_coefficient=0.1)
+        recursive = MultiPendulum([0.0]*N, [0.0]*N, rod_lengths, masses, [0.0, 0.0], damping_coefficient=0.1, dynamics="recursive")
+        states = rng.normal(scale=2.0, size=(samples, 2*N))
+        errors = [np.max(np.abs(recursive.derivative_func(0, state) - dense.derivative_func(0, state))) / np.max(np.abs(dense.derivative_func(0, state)))
+                  for state in states]
+        results.append({"N": N, "max_relative_error": float(np.max(errors))})
+    return results
+
+def check_numba_backend(sizes=None, samples=20, seed=0):
+    # Largest differences between the numba and numpy backends over random states, relative to the numpy
+    # values: derivatives and energies for both dynamics, and the fused RK4 step for dense chains.
+    if not kernels.numba_available():
+        return []
+    sizes = CONSISTENCY_SIZES if sizes is None else sizes
+    rng = np.random.default_rng(seed)
+    relative_error = lambda values, reference: float(np.max(np.abs(values - reference)) / np.max(np.abs(reference)))
+    results = []
+    for dynamics in ["dense", "recursive"]:
+        for N in sizes:
+            rod_lengths = list(rng.uniform(0.5, 2.0, N))
+            masses = list(rng.uniform(0.5, 2.0, N))
+            numpy_system = MultiPendulum([0.0]*N, [0.0]*N, rod_lengths, masses, [0.0, 0.0], damping_coefficient=0.1, dynamics=dynamics)
+            numba_system = MultiPendulum([0.0]*N, [0.0]*N, rod_lengths, masses, [0.0, 0.0], damping_coefficient=0.1, backend="numba", dynamics=dynamics)
+            states = rng.normal(scale=2.0, size=(samples, 2*N))
+
+            entry = {"N": N, "dynamics": dynamics}
+            entry["derivative"] = max(relative_error(numba_system.derivative_func(0, state), numpy_system.derivative_func(0, state)) for state in states)
+            entry["kinetic_energy"] = relative_error(numba_system.get_kinetic_energy(states), numpy_system.get_kinetic_energy(states))
+            entry["potential_energy"] = relative_error(numba_system.get_potential_energy(states), numpy_system.get_potential_energy(states))
+            if numba_system.rk4_kernel is not None:
+                rk4 = RK4()
+                numpy_steps = []
+                for state in states:
+                    numpy_system.set_state(state, 0)
+                    rk4.step(numpy_system, 0, 0.01)
+                    numpy_steps.append(numpy_system.get_state())
+                entry["rk4_step"] = max(relative_error(numba_system.rk4_kernel(0, state, 0.01), numpy_step) for state, numpy_step in zip(states, numpy_steps))
+            results.append(entry)
+    return results
+
+def benchmark_solvers(sizes, min_time):
+    results = []
+    for solver_name, solver_class in solver_name_to_class.items():
+        for N in sizes:
+            system = build_chain(N)
+            solver = solver_class()
+            t = [0.0]
+
+            def step():
+                solver.step(system, t[0], 0.01)
+                t[0] += 0.01
+
+            step()
+            results.append({"name": "step:" + solver_name, "N": N, "M": 1, "backend": "numpy",
+                            "seconds_per_call": time_call(step, min_time)})
+    return results
+
+def benchmark_ensembles(ensemble_sizes, min_time, N=4):
+    results = []
+    for backend in get_backends():
+        for M in ensemble_sizes:
+            ensemble = MultiPendulumEnsemble.from_pendulum(build_chain(N, backend), np.linspace(0, 1e-3, M))
+            state = ensemble.get_state()
+            solver = solver_name_to_class["rk4"]()
+            ensemble.derivative_func(0, state)
+            solver.step(ensemble, 0, 0.01)
+
+            results.append({"name": "derivative_func", "N": N, "M": M, "backend": backend,
+                            "seconds_per_call": time_call(lambda: ensemble.derivative_func(0, state), min_time)})
+            results.append({"name": "step:rk4", "N": N, "M": M, "backend": backend,
+                            "seconds_per_call": time_call(lambda: solver.step(ensemble, 0, 0.01), min_time)})
+    return results
+
+def benchmark_trackers(min_time, N=4):
+    results = []
+    # Trackers follow a precomputed RK4 trajectory so that trails have realistic shapes. Each tracker has a
+    # system of its own, and set_state updates only the tracker attached to it.
+    system = build_chain(N)
+    solver = solver_name_to_class["rk4"]()
+    states = []
+    for step in range(2000):
+        solver.step(system, step * 0.01, 0.01)
+        states.append(system.get_state())
+    t = [0.0]
+
+    def fill(tracker, seconds):
+        for _ in range(int(seconds / 0.01)):
+            update(tracker)
+
+    def update(tracker):
+        t[0] += 0.01
+        tracker.system.set_state(states[int(round(t[0] / 0.01)) % len(states)], t[0])
+
+    trajectory_tracker = TrajectoryTracker(max_time_spans=[100]*N, system=build_chain(N))
+    energy_tracker = EnergyTracker(max_time_span=600, system=build_chain(N), plot_position=[100, 100], plot_width=400, plot_height=150)
+
+    results.append({"name": "update:TrajectoryTracker", "N": N, "M": 1, "backend": "numpy",
+                    "seconds_per_call": time_call(lambda: update(trajectory_tracker), min_time)})
+    results.append({"name": "update:EnergyTracker", "N": N, "M": 1, "backend": "numpy",
+                    "seconds_per_call": time_call(lambda: update(energy_tracker), min_time)})
+
+    try:
+        import pygame
+    except ImportError:
+        return results
+
+    # Drawing is timed with full buffers, onto an off-screen surface so no window is needed.
+    fill(trajectory_tracker, 100)
+    fill(energy_tracker, 600)
+    surface = pygame.Surface((1200, 600))
+    results.append({"name": "draw:TrajectoryTracker", "N": N, "M": 1, "backend": "numpy",
+                    "seconds_per_call": time_call(lambda: trajectory_tracker.draw(surface), min_time)})
+    results.append({"name": "draw:EnergyTracker", "N": N, "M": 1, "backend": "numpy",
+                    "seconds_per_call": time_call(lambda: energy_tracker.draw(surface), min_time)})
+
+    # Incremental trails only pay for new segments, so each timed call adds a sample before drawing.
+    incremental_tracker = TrajectoryTracker(max_time_spans=[100]*N, system=build_chain(N), incremental=True)
+    fill(incremental_tracker, 100)
+
+    def draw_incremental():
+        update(incremental_tracker)
+        incremental_tracker.draw(surface)
+
+    results.append({"name": "draw:TrajectoryTracker(incremental)", "N": N, "M": 1, "backend": "numpy",
+                    "seconds_per_call": time_call(draw_incremental, min_time)})
+    return results
+
+def integrate(system, solver, t_end, dt):
+    system.set_state(system.get_initial_state(), 0)
+    steps = int(round(t_end / dt))
+    start = time.perf_counter()
+    for step in range(steps):
+        solver.step(system, step * dt, dt)
+    return time.perf_counter() - start, system.get_state()
+
+def work_precision(N=2, t_end=2.0):
+    # Error at t_end against a tight-tolerance Dormand-Prince reference, versus wall time.
+    system = build_chain(N)
+    _, reference = integrate(system, DormandPrince45(rtol=1e-13, atol=1e-13), t_end, t_end)
+
+    results = []
+    for solver_name, solver_class in solver_name_to_class.items():
+        if solver_class.adaptive:
+            for tolerance in WORK_PRECISION_TOLERANCES:
+                seconds, state = integrate(system, solver_class(rtol=tolerance, atol=tolerance), t_end, t_end)
+                results.append({"solver": solver_name, "N": N, "rtol": tolerance, "seconds": seconds,
+                                "error": float(np.max(np.abs(state - reference)))})
+        else:
+            for dt in WORK_PRECISION_STEPS:
+                seconds, state = integrate(system, solver_class(), t_end, dt)
+                results.append({"solver": solver_name, "N": N, "dt": dt, "seconds": seconds,
+                                "error": float(np.max(np.abs(state - reference)))})
+    return results
+
+def run_benchmarks(sizes=None, ensemble_sizes=None, min_time=0.2, include_work_precision=True):
+    recursive_sizes = RECURSIVE_SIZES if sizes is None else sizes
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    ensemble_sizes = DEFAULT_ENSEMBLE_SIZES if ensemble_sizes is None else ensemble_sizes
+
+    timings = benchmark_system(sizes, min_time)
+    timings += benchmark_recursive(recursive_sizes, min_time)
+    timings += benchmark_solvers(sizes, min_time)
+    timings += benchmark_ensembles(ensemble_sizes, min_time)
+    timings += benchmark_trackers(min_time)
+
+    return {
+        "metadata": {
+            "python"    : platform.python_version(),
+            "numpy"     : np.__version__,
+            "platform"  : platform.platform(),
+            "processor" : platform.processor(),
+            "timestamp" : time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "timings": timings,
+        "work_precision": work_precision() if include_work_precision else [],
+        "recursive_consistency": check_recursive_dynamics(),
+        "numba_consistency": check_numba_backend()
+    }
+
+def timing_key(entry):
+    return (entry["name"], entry["N"], entry["M"], entry["backend"])
+
+def compare(results, baseline, threshold=1.2):
+    # Lines for every timing present in both runs; ratios above threshold are flagged as regressions.
+    baseline_timings = {timing_key(entry): entry["seconds_per_call"] for entry in baseline["timings"]}
+    lines = []
+    for entry in results["timings"]:
+        key = timing_key(entry)
+        if key not in baseline_timings:
+            continue
+        ratio = entry["seconds_per_call"] / baseline_timings[key]
+        flag = "  REGRESSION" if ratio > threshold else ""
+        lines.append(f"{key[0]:<28} N={key[1]:<4} M={key[2]:<5} {key[3]:<6} {ratio:6.2f}x{flag}")
+    return lines
+
+def format_results(results):
+    lines = []
+    for entry in results["timings"]:
+        lines.append(f"{entry['name']:<28} N={entry['N']:<4} M={entry['M']:<5} {entry['backend']:<6} {1e6 * entry['seconds_per_call']:12.2f} us")
+    for entry in results.get("recursive_consistency", []):
+        lines.append(f"recursive vs dense N={entry['N']:<4} max relative error {entry['max_relative_error']:.3e}")
+    for entry in results.get("numba_consistency", []):
+        errors = "  ".join(f"{name} {entry[name]:.3e}" for name in ["derivative", "kinetic_energy", "potential_energy", "rk4_step"] if name in entry)
+        lines.append(f"numba vs numpy {entry['dynamics']:<9} N={entry['N']:<4} max relative error  {errors}")
+    for entry in results["work_precision"]:
+        setting = "dt=" + str(entry["dt"]) if "dt" in entry else "rtol=" + str(entry["rtol"])
+        lines.append(f"{entry['solver']:<18} {setting:<14} {entry['seconds']:8.4f} s   error {entry['error']:.3e}")
+    return lines
+
+def save_results(results, path):
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+
+def load_results(path):
+    with open(path) as file:
+        return json.load(file)
@@ -0,0 +1,166 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dynamic_systems import MultiPendulumEnsemble
+from solvers import RK4
+
+# Chaos maps for the double pendulum over grids of initial (theta1, theta2), both links starting at rest.
+# Angles follow MultiPendulum: measured from the +x axis with y pointing down, so hanging straight down is
+# pi/2 and a link has flipped once it has swung more than pi away from that.
+
+HANGING_ANGLE = np.pi / 2
+
+def angle_grid(resolution, theta_range=(HANGING_ANGLE - np.pi, HANGING_ANGLE + np.pi)):
+    # Returns the (resolution, resolution, 2) grid of initial angles; rows follow theta2 and columns theta1.
+    # Points sit at cell centres, so none starts exactly upright on the border of the default range.
+    cell = (theta_range[1] - theta_range[0]) / resolution
+    angles = theta_range[0] + cell * (np.arange(resolution) + 0.5)
+    theta1, theta2 = np.meshgrid(angles, angles)
+    return np.stack([theta1, theta2], axis=-1)
+
+def build_ensemble(thetas, config):
+    return MultiPendulumEnsemble(
+        thetas=thetas,
+        thetadots=np.zeros_like(thetas),
+        rod_lengths=config["rod_lengths"],
+        masses=config["masses"],
+        position=[0.0, 0.0],
+        damping_coefficient=config["damping_coefficient"],
+        backend=config["backend"]
+    )
+
+def can_flip(ensemble):
+    # A link can only go over the top if the energy allows it to be upright with every other link hanging
+    # down. Damping only removes energy, so members below that threshold never flip and need no integration.
+    minimum_flip_energy = -np.sum(ensemble.gravity_coefficients) + 2 * np.min(ensemble.gravity_coefficients)
+    return ensemble.get_kinetic_energy() + ensemble.get_potential_energy() > minimum_flip_energy
+
+def flip_time_chunk(thetas, config):
+    flip_times = np.full(len(thetas), np.nan)
+    active = np.flatnonzero(can_flip(build_ensemble(thetas, config)))
+    if len(active) == 0:
+        return flip_times
+
+    ensemble = build_ensemble(thetas[active], config)
+    pending = np.ones(len(active), dtype=bool)
+    solver = RK4()
+    dt = config["dt"]
+    steps = int(round(config["t_max"] / dt))
+
+    # A flip is a link's distance from hanging down crossing pi from below, so members that start beyond
+    # upright are not counted until they swing back and over again.
+    deviations = np.abs(ensemble.thetas - HANGING_ANGLE)
+    for step in range(steps):
+        solver.step(ensemble, step * dt, dt)
+        previous_deviations, deviations = deviations, np.abs(ensemble.thetas - HANGING_ANGLE)
+        flipped = pending & np.any((previous_deviations <= np.pi) & (deviations > np.pi), axis=1)
+        if not np.any(flipped):
+            continue
+
+        flip_times[active[flipped]] = (step + 1) * dt
+        pending &= ~flipped
+        if not np.any(pending):
+            break
+        # Once a quarter of the ensemble has flipped it is rebuilt from the pending members only.
+        if np.count_nonzero(pending) < 0.75 * len(pending):
+            state = ensemble.get_state()[pending]
+            active = active[pending]
+            deviations = deviations[pending]
+            pending = np.ones(len(active), dtype=bool)
+            ensemble = build_ensemble(state[:, :ensemble.N], config)
+            ensemble.set_state(state, (step + 1) * dt)
+
+    return flip_times
+
+def lyapunov_chunk(thetas, config):
+    # Two-trajectory method: each member is paired with a copy displaced by d0 in state space, and the pair's
+    # separation is measured and rescaled back to d0 every renormalization interval.
+    M = len(thetas)
+    d0 = config["perturbation"]
+    ensemble = build_ensemble(np.concatenate([thetas, thetas]), config)
+    state = ensemble.get_state()
+    state[M:, :2] += d0 / np.sqrt(2)
+    ensemble.set_state(state, 0)
+
+    solver = RK4()
+    dt = config["dt"]
+    steps = int(round(config["t_max"] / dt))
+    interval = config["renormalization_steps"]
+    log_stretch = np.zeros(M)
+
+    for step in range(steps):
+        solver.step(ensemble, step * dt, dt)
+        if (step + 1) % interval != 0 and step + 1 != steps:
+            continue
+
+        state = ensemble.get_state()
+        separation = state[M:] - state[:M]
+        distance = np.linalg.norm(separation, axis=1)
+        log_stretch += np.log(distance / d0)
+        state[M:] = state[:M] + separation * (d0 / distance)[:, None]
+        ensemble.set_state(state, (step + 1) * dt)
+
+    return log_stretch / (steps * dt)
+
+def run_chunks(func, grid, config, workers=None, chunk_size=4096):
+    thetas = grid.reshape(-1, 2)
+    chunks = [thetas[start:start + chunk_size] for start in range(0, len(thetas), chunk_size)]
+    workers = os.cpu_count() if workers is None else workers
+
+    if workers <= 1:
+        results = [func(chunk, config) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(func, chunks, [config] * len(chunks)))
+
+    return np.concatenate(results).reshape(grid.shape[:-1])
+
+def make_config(rod_lengths=(1.0, 1.0), masses=(1.0, 1.0), damping_coefficient=0.0, dt=0.01, t_max=10.0,
+                backend="numpy", perturbation=1e-8, renormalization_steps=10):
+    return {
+        "rod_lengths"           : list(rod_lengths),
+        "masses"                : list(masses),
+        "damping_coefficient"   : damping_coefficient,
+        "dt"                    : dt,
+        "t_max"                 : t_max,
+        "backend"               : backend,
+        "perturbation"          : perturbation,
+        "renormalization_steps" : renormalization_steps
+    }
+
+def flip_time_map(grid, config, workers=None, chunk_size=4096):
+    # Time until either link first flips, NaN where it does not flip within t_max.
+    return run_chunks(flip_time_chunk, grid, config, workers, chunk_size)
+
+def lyapunov_map(grid, config, workers=None, chunk_size=4096):
+    # Finite-time estimate of the largest Lyapunov exponent over [0, t_max].
+    return run_chunks(lyapunov_chunk, grid, config, workers, chunk_size)
+
+def to_rgb(values, log_scale=False):
+    # Maps the finite values onto a dark blue to yellow ramp; NaN (never flipped) is drawn black.
+    values = np.log10(values) if log_scale else np.asarray(values, dtype=float)
+    finite = np.isfinite(values)
+    rgb = np.zeros(values.shape + (3,), dtype=np.uint8)
+    if not np.any(finite):
+        return rgb
+
+    low, high = np.min(values[finite]), np.max(values[finite])
+    scaled = (values[finite] - low) / (high - low) if high > low else np.zeros(np.count_nonzero(finite))
+    low_color = np.array([20, 30, 110])
+    high_color = np.array([250, 230, 60])
+    rgb[finite] = (low_color + scaled[:, None] * (high_color - low_color)).astype(np.uint8)
+    return rgb
+
+def make_surface(values, log_scale=False):
+    import pygame
+
+    # surfarray indexes surfaces as (x, y), so the row-major map is transposed.
+    return pygame.surfarray.make_surface(np.transpose(to_rgb(values, log_scale), (1, 0, 2)))
+
+def save_map(values, path, log_scale=False):
+    if path.endswith(".npy"):
+        np.save(path, values)
+        return
+
+    import pygame
+    pygame.image.save(make_surface(values, log_scale), path)
@@ -0,0 +1,48 @@
+import numpy as np
+
+class CheckpointStore:
+    # Keeps states at least `interval` apart. When the store is full every other checkpoint is evicted and
+    # the interval doubles, so memory stays bounded while the whole run remains covered.
+    def __init__(self, state_size, interval=1.0, capacity=512):
+        if capacity < 2:
+            raise Exception("Checkpoint store capacity must be at least 2.")
+
+        self.interval = interval
+        self.capacity = capacity
+        self.times = np.empty(capacity)
+        self.states = np.empty((capacity, state_size))
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, t, state):
+        if self.size == self.capacity:
+            self.thin()
+
+        self.times[self.size] = t
+        self.states[self.size] = state
+        self.size += 1
+
+    def update(self, t, state):
+        if self.size == 0 or t - self.times[self.size-1] >= self.interval:
+            self.add(t, state)
+
+    def thin(self):
+        kept = np.arange(0, self.size, 2)
+        self.size = len(kept)
+        self.times[:self.size] = self.times[kept]
+        self.states[:self.size] = self.states[kept]
+        self.interval *= 2
+
+    def latest_at_or_before(self, t):
+        index = np.searchsorted(self.times[:self.size], t, side="right") - 1
+        if index < 0:
+            return None
+        return self.times[index], self.states[index].copy()
+
+    def truncate_after(self, t):
+        self.size = int(np.searchsorted(self.times[:self.size], t, side="right"))
+
+    def clear(self):
+        self.size = 0
@@ -0,0 +1,105 @@
+import hashlib
+import importlib.util
+import inspect
+import os
+
+# Turns the symbolic kinetic and potential energies of a DynamicSystem subclass into a plain NumPy module and
+# caches it on disk. The cache key only depends on the class source, so a warm start never imports SymPy.
+
+CODEGEN_VERSION = 1
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".kernel_cache")
+
+_loaded_modules = {}
+
+def system_hash(system_class):
+    source = inspect.getsource(system_class)
+    key = str(CODEGEN_VERSION) + "\n" + system_class.__module__ + "." + system_class.__qualname__ + "\n" + source
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+def load_kernels(system_class):
+    if system_class in _loaded_modules:
+        return _loaded_modules[system_class]
+
+    path = os.path.join(CACHE_DIRECTORY, system_class.__name__.lower() + "_" + system_hash(system_class) + ".py")
+    if not os.path.exists(path):
+        source = generate_source(system_class)
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        temporary_path = path + "." + str(os.getpid()) + ".tmp"
+        with open(temporary_path, "w") as file:
+            file.write(source)
+        os.replace(temporary_path, path)
+
+    spec = importlib.util.spec_from_file_location("generated_" + system_class.__name__.lower(), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    _loaded_modules[system_class] = module
+    return module
+
+def function_source(name, arguments, header_lines, output_shape, entries, printer, sympy):
+    # entries: list of (index tuple, expression); everything shares one common subexpression elimination pass.
+    indices = [index for index, _ in entries]
+    expressions = [expression for _, expression in entries]
+    replacements, reduced = sympy.cse(expressions, symbols=sympy.numbered_symbols("_cse"))
+
+    lines = ["def " + name + "(" + ", ".join(arguments) + "):"]
+    lines += ["    " + line for line in header_lines]
+    for symbol, expression in replacements:
+        lines.append("    " + str(symbol) + " = " + printer.doprint(expression))
+    lines.append("    out = numpy.zeros(shape + " + str(tuple(output_shape)) + ")")
+    for index, expression in zip(indices, reduced):
+        if expression != 0:
+            lines.append("    out[" + ", ".join(["..."] + [str(i) for i in index]) + "] = " + printer.doprint(expression))
+    lines.append("    return out[()]")
+
+    return "\n".join(lines) + "\n"
+
+def generate_source(system_class):
+    import sympy
+    from sympy.printing.numpy import NumPyPrinter
+
+    printer = NumPyPrinter()
+    n = len(system_class.coordinate_names)
+    q  = [sympy.Symbol(name) for name in system_class.coordinate_names]
+    qd = [sympy.Symbol(name + "_dot") for name in system_class.coordinate_names]
+    p  = [sympy.Symbol(name) for name in system_class.parameter_names]
+
+    T = sympy.expand(system_class.kinetic_energy(q, qd, p))
+    V = system_class.potential_energy(q, p)
+    L = T - V
+    positions = system_class.positions(q, p)
+
+    # Euler-Lagrange: M(q) qddot = dL/dq - (d^2 L / dqdot dq) qdot, with M the qdot Hessian of T.
+    mass_matrix = [[sympy.diff(T, qd[i], qd[j]) for j in range(n)] for i in range(n)]
+    lagrangian_gradient = [sympy.diff(L, q[i]) for i in range(n)]
+    forces = [lagrangian_gradient[i] - sum(sympy.diff(L, qd[i], q[j]) * qd[j] for j in range(n)) for i in range(n)]
+    variables = q + qd
+
+    unpack_state = ["shape = q.shape[:-1]"]
+    unpack_state += [str(q[i]) + " = q[..., " + str(i) + "]" for i in range(n)]
+    unpack_velocities = [str(qd[i]) + " = qd[..., " + str(i) + "]" for i in range(n)]
+    unpack_parameters = [str(p[i]) + " = p[" + str(i) + "]" for i in range(len(p))]
+    q_header = unpack_state + unpack_parameters
+    state_header = unpack_state + unpack_velocities + unpack_parameters
+
+    functions = [
+        function_source("mass_matrix", ["q", "p"], q_header, (n, n),
+                        [((i, j), mass_matrix[i][j]) for i in range(n) for j in range(n)], printer, sympy),
+        function_source("mass_matrix_derivatives", ["q", "p"], q_header, (n, n, n),
+                        [((k, i, j), sympy.diff(mass_matrix[i][j], q[k])) for k in range(n) for i in range(n) for j in range(n)], printer, sympy),
+        function_source("forces", ["q", "qd", "p"], state_header, (n,),
+                        [((i,), forces[i]) for i in range(n)], printer, sympy),
+        function_source("force_jacobian", ["q", "qd", "p"], state_header, (n, 2*n),
+                        [((i, k), sympy.diff(forces[i], variables[k])) for i in range(n) for k in range(2*n)], printer, sympy),
+        function_source("lagrangian_gradient", ["q", "qd", "p"], state_header, (n,),
+                        [((i,), lagrangian_gradient[i]) for i in range(n)], printer, sympy),
+        function_source("kinetic_energy", ["q", "qd", "p"], state_header, (),
+                        [((), T)], printer, sympy),
+        function_source("potential_energy", ["q", "p"], q_header, (),
+                        [((), V)], printer, sympy),
+        function_source("positions", ["q", "p"], q_header, (len(positions), 2),
+                        [((i, axis), positions[i][axis]) for i in range(len(positions)) for axis in range(2)], printer, sympy)
+    ]
+
+    header = "# Generated by codegen.py from " + system_class.__qualname__ + ". Do not edit.\nimport numpy\n\n"
+    return header + "\n".join(functions)
@@ -1,9 +1,16 @@
-import pygame
 from constants import WINDOW_WIDTH, WINDOW_HEIGHT
 from consolecommands import ConsoleCommands
-pygame.init()
+from rendering import TextCache
 
-font = pygame.font.SysFont("Consolas", 20)
+font = None
+
+def get_font():
+    global font
+    if font is None:
+        import pygame
+        pygame.font.init()
+        font = pygame.font.SysFont("Consolas", 20)
+    return font
 
 class Console():
     def __init__(self, max_log_lines=7):
@@ -11,6 +18,7 @@ class Console():
         self.log_lines = []
         self.max_log_lines = max_log_lines
         self.commands = ConsoleCommands()
+        self.text_cache = TextCache(get_font, capacity=4 * max_log_lines)
 
     def set_command(self, command_name, func, parameter_types, description=""):
         self.commands.set(command_name, func, parameter_types, description)
@@ -43,13 +51,15 @@ class Console():
         self.log_lines = []
 
     def draw(self, screen):
+        import pygame
+
         CONSOLE_HEIGHT = WINDOW_HEIGHT // 3
         pygame.draw.rect(screen, (0, 0, 0), (0, WINDOW_HEIGHT - CONSOLE_HEIGHT, WINDOW_WIDTH, CONSOLE_HEIGHT))
         pygame.draw.rect(screen, (255, 255, 255), (0, WINDOW_HEIGHT - CONSOLE_HEIGHT, WINDOW_WIDTH, CONSOLE_HEIGHT), 2)
 
         for i, line in enumerate(self.log_lines):
-            txt_surf = font.render(line, True, (255, 255, 255))
+            txt_surf = self.text_cache.render(line, (255, 255, 255))
             screen.blit(txt_surf, (10, WINDOW_HEIGHT - CONSOLE_HEIGHT + 10 + i * 22))
 
-        input_surf = font.render("> " + self.input_text, True, (0, 255, 0))
+        input_surf = self.text_cache.render("> " + self.input_text, (0, 255, 0))
         screen.blit(input_surf, (10, WINDOW_HEIGHT - 30))
\ No newline at end of file
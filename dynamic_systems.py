@@ -1,9 +1,57 @@
 import numpy as np
-import pygame
+import kernels
+import codegen
+from scipy.linalg import solveh_banded
 from constants import COLORS, g
 
-class MultiPendulum:
-    def __init__(self, thetas, thetadots, rod_lengths, masses, position, damping_coefficient=0.0):
+def solve_tridiagonal(diagonal, off_diagonal, rhs):
+    # Thomas algorithm along the last axis, vectorized over any leading axes of off_diagonal and rhs.
+    N = rhs.shape[-1]
+    eliminated = np.empty(rhs.shape[:-1] + (max(N-1, 0),))
+    solution = np.empty_like(rhs)
+
+    denominator = diagonal[0]
+    solution[..., 0] = rhs[..., 0] / denominator
+    for k in range(N-1):
+        eliminated[..., k] = off_diagonal[..., k] / denominator
+        denominator = diagonal[k+1] - off_diagonal[..., k] * eliminated[..., k]
+        solution[..., k+1] = (rhs[..., k+1] - off_diagonal[..., k] * solution[..., k]) / denominator
+    for k in range(N-2, -1, -1):
+        solution[..., k] -= eliminated[..., k] * solution[..., k+1]
+
+    return solution
+
+class TrackedSystem:
+    def update_trackers(self, t):
+        # Trackers with a sampling_interval of None are sampled once per frame through update_frame_trackers.
+        for tracker in self.trackers:
+            if tracker.sampling_interval is None:
+                continue
+            if t < tracker.last_sample_time or t - tracker.last_sample_time >= tracker.sampling_interval:
+                tracker.last_sample_time = t
+                tracker.update(t)
+
+    def update_frame_trackers(self, t):
+        for tracker in self.trackers:
+            if tracker.sampling_interval is None:
+                tracker.last_sample_time = t
+                tracker.update(t)
+
+    def attach_tracker(self, tracker):
+        if tracker in self.trackers:
+            return
+
+        self.trackers.append(tracker)
+
+    def detach_tracker(self, tracker):
+        if tracker in self.trackers:
+            self.trackers.remove(tracker)
+
+    def set_damping_coefficient(self, damping_coefficient):
+        self.damping_coefficient = damping_coefficient
+
+class MultiPendulum(TrackedSystem):
+    def __init__(self, thetas, thetadots, rod_lengths, masses, position, damping_coefficient=0.0, backend="numpy", dynamics="dense"):
         self.initial_thetas = thetas.copy()
         self.initial_thetadots = thetadots.copy()
         self.thetas = thetas.copy()
@@ -14,8 +62,12 @@ class MultiPendulum:
         self.damping_coefficient = damping_coefficient
         self.N = len(thetas)
         self.mass_suffix_sums = self.precompute_mass_suffix_sums()
+        self.set_dynamics(dynamics)
+        self.set_backend(backend)
         self.update_pendulum_positions()
         self.trackers = []
+        self.color = COLORS["white"]
+        self.render_state = None
 
     @classmethod
     def single(cls, theta, thetadot, rod_length, mass, position, damping_coefficient=0.0):
@@ -50,24 +102,126 @@ class MultiPendulum:
         mass_suffix_sums.reverse()
         return mass_suffix_sums
 
+    def precompute_derivative_buffers(self):
+        N = self.N
+        L = np.asarray(self.rod_lengths, dtype=float)
+        mass_suffix_sums = np.asarray(self.mass_suffix_sums, dtype=float)
+
+        self.rod_length_array = L
+
+        self._suffix_mass_matrix = None
+        self._mass_length_matrix = None
+        self.gravity_coefficients = g * mass_suffix_sums * L
+        self.mass_array = np.asarray(self.masses, dtype=float)
+        self.inverse_masses = 1 / self.mass_array
+        self.tension_diagonal = self.inverse_masses + np.concatenate([[0.0], self.inverse_masses[:-1]])
+
+        # The recursive formulation never touches the N x N scratch buffers, which matters for long chains.
+        if self.dynamics != "dense":
+            return
+
+        self._angle_differences = np.empty((N, N))
+        self._cos_differences   = np.empty((N, N))
+        self._sin_differences   = np.empty((N, N))
+        self._A                 = np.empty((N, N))
+        self._b                 = np.empty(N)
+
+    # The N x N matrices are built on first use: dense dynamics always need them, recursive chains only for
+    # Jacobians, normal modes or Stormer-Verlet, and they would dominate construction of a long chain.
+    @property
+    def suffix_mass_matrix(self):
+        if self._suffix_mass_matrix is None:
+            indices = np.arange(self.N)
+            mass_suffix_sums = np.asarray(self.mass_suffix_sums, dtype=float)
+            self._suffix_mass_matrix = mass_suffix_sums[np.maximum(indices[:, None], indices[None, :])]
+        return self._suffix_mass_matrix
+
+    @property
+    def mass_length_matrix(self):
+        if self._mass_length_matrix is None:
+            L = self.rod_length_array
+            self._mass_length_matrix = self.suffix_mass_matrix * L[:, None] * L[None, :]
+        return self._mass_length_matrix
+
+    def set_backend(self, backend):
+        # "numpy" is the reference path, "numba" uses the compiled loop kernels, "auto" picks numba when installed.
+        if backend == "auto":
+            backend = "numba" if kernels.numba_available() else "numpy"
+        if backend == "numba":
+            kernels.compile_kernels()
+        elif backend != "numpy":
+            raise Exception("Backend '" + str(backend) + "' not recognized.")
+        self.backend = backend
+
+    def set_dynamics(self, dynamics):
+        # "dense" solves the full mass matrix in O(N^3); "recursive" solves for the rod tensions in O(N).
+        if dynamics not in ["dense", "recursive"]:
+            raise Exception("Dynamics \'" + str(dynamics) + "\' not recognized.")
+        self.dynamics = dynamics
+        self.precompute_derivative_buffers()
+
+    @property
+    def rk4_kernel(self):
+        return self.numba_rk4_step if self.backend == "numba" and self.dynamics == "dense" else None
+
+    def recursive_derivative(self, state):
+        N = self.N
+        thetas    = state[..., :N]
+        thetadots = state[..., N:]
+        damping_coefficients = np.asarray(self.damping_coefficient, dtype=float)
+        if state.ndim > 1:
+            damping_coefficients = damping_coefficients.reshape(-1, 1)
+
+        # Rod tensions from the tridiagonal system documented in kernels.multipendulum_chain_derivative_into
+        differences = thetas[..., 1:] - thetas[..., :-1]
+        off_diagonal = -np.cos(differences) * self.inverse_masses[:-1]
+        rhs = self.rod_length_array * thetadots * thetadots
+        rhs[..., 0] += g * np.sin(thetas[..., 0])
+
+        if state.ndim == 1 and N > 1:
+            banded = np.empty((2, N))
+            banded[0, 0] = 0.0
+            banded[0, 1:] = off_diagonal
+            banded[1] = self.tension_diagonal
+            tensions = solveh_banded(banded, rhs)
+        else:
+            tensions = solve_tridiagonal(self.tension_diagonal, off_diagonal, rhs)
+
+        sin_differences = np.sin(differences) * self.inverse_masses[:-1]
+        accelerations = np.zeros_like(thetas)
+        accelerations[..., :-1] += tensions[..., 1:] * sin_differences
+        accelerations[..., 1:] -= tensions[..., :-1] * sin_differences
+        accelerations[..., 0] += g * np.cos(thetas[..., 0])
+        thetaddots = accelerations / self.rod_length_array - damping_coefficients * thetadots
+
+        return np.concatenate([thetadots, thetaddots], axis=-1)
+
+    def numba_rk4_step(self, t, state, dt):
+        return kernels.multipendulum_rk4_step(state, dt, self.mass_length_matrix, self.gravity_coefficients, float(self.damping_coefficient))
+
     def derivative_func(self, t, state):
+        if self.dynamics == "recursive":
+            if self.backend == "numba":
+                return kernels.multipendulum_chain_derivative(state, self.rod_length_array, self.mass_array, g, float(self.damping_coefficient))
+            return self.recursive_derivative(state)
+        if self.backend == "numba":
+            return kernels.multipendulum_derivative(state, self.mass_length_matrix, self.gravity_coefficients, float(self.damping_coefficient))
+
         N = self.N
-        L = self.rod_lengths
         thetas    = state[:N]
         thetadots = state[N:]
-        thetaddots = np.zeros(N)
 
         # --- See README for derivation ---
-        A = np.zeros((N, N))
-        b = np.zeros(N)
+        # A[n][j] = M[max(j, n)] * L[j] * L[n] * cos(theta_j - theta_n)
+        # b[n]    = g * M[n] * L[n] * cos(theta_n) + sum_j M[max(j, n)] * L[j] * L[n] * thetadot_j^2 * sin(theta_j - theta_n)
+        np.subtract(thetas[None, :], thetas[:, None], out=self._angle_differences)
+        np.cos(self._angle_differences, out=self._cos_differences)
+        np.sin(self._angle_differences, out=self._sin_differences)
 
-        for n in range(N):
-            for j in range(N):
-                mass_sum = self.mass_suffix_sums[max(j, n)]
-                A[n][j] = mass_sum * L[j] * L[n] * np.cos(thetas[j] - thetas[n])
-                if j == n:
-                    b[n] += g * mass_sum * L[n] * np.cos(thetas[n])
-                b[n] += mass_sum * L[j] * L[n] * thetadots[j] * thetadots[j] * np.sin(thetas[j] - thetas[n])
+        A = np.multiply(self.mass_length_matrix, self._cos_differences, out=self._A)
+        np.multiply(self.mass_length_matrix, self._sin_differences, out=self._sin_differences)
+        b = np.dot(self._sin_differences, thetadots * thetadots, out=self._b)
+        b += self.gravity_coefficients * np.cos(thetas)
 
         undamped_thetaddots = np.linalg.solve(A, b)
         # --- See README for derivation ---
@@ -76,38 +230,90 @@ class MultiPendulum:
 
         return np.concatenate([thetadots, thetaddots])
     
-    def update_pendulum_positions(self):
-        self.pendulum_positions = []
-        current_pendulum_position = self.position.copy()
+    def jacobian_func(self, t, state):
+        N = self.N
+        thetas    = state[..., :N]
+        thetadots = state[..., N:]
+        identity = np.eye(N)
+
+        angle_differences = thetas[..., None, :] - thetas[..., :, None]
+        A = self.mass_length_matrix * np.cos(angle_differences)
+        S = self.mass_length_matrix * np.sin(angle_differences)
+        squared_thetadots = thetadots * thetadots
+        b = np.einsum("...nj,...j->...n", S, squared_thetadots) + self.gravity_coefficients * np.cos(thetas)
+        undamped_thetaddots = np.linalg.solve(A, b[..., None])[..., 0]
+
+        # Differentiating A @ thetaddots = b gives A @ d(thetaddots) = db - dA @ thetaddots
+        diagonal = np.einsum("...nj,...j->...n", A, squared_thetadots) + np.einsum("...nj,...j->...n", S, undamped_thetaddots) + self.gravity_coefficients * np.sin(thetas)
+        theta_rhs = A * squared_thetadots[..., None, :] + S * undamped_thetaddots[..., None, :] - identity * diagonal[..., :, None]
+        thetadot_rhs = 2 * S * thetadots[..., None, :]
+        derivatives = np.linalg.solve(A, np.concatenate([theta_rhs, thetadot_rhs], axis=-1))
+
+        damping_coefficients = np.asarray(self.damping_coefficient, dtype=float).reshape(-1, 1, 1)
+        if state.ndim == 1:
+            damping_coefficients = damping_coefficients[0]
+
+        J = np.zeros(state.shape[:-1] + (2*N, 2*N))
+        J[..., :N, N:] = identity
+        J[..., N:, :N] = derivatives[..., :N]
+        J[..., N:, N:] = derivatives[..., N:] - damping_coefficients * identity
+
+        return J
+
+    def mass_matrix(self, thetas):
+        return self.mass_length_matrix * np.cos(thetas[..., None, :] - thetas[..., :, None])
+
+    def momentum_derivative(self, thetas, thetadots):
+        # Undamped dp/dt = -dH/dtheta for the momenta p = mass_matrix(thetas) @ thetadots
+        sin_differences = np.sin(thetas[..., :, None] - thetas[..., None, :])
+        coriolis = np.einsum("...nj,...j->...n", self.mass_length_matrix * sin_differences, thetadots)
+        return self.gravity_coefficients * np.cos(thetas) - thetadots * coriolis
+
+    def positions_from_thetas(self, thetas):
+        L = self.rod_length_array
+        offsets = np.stack([L * np.cos(thetas), L * np.sin(thetas)], axis=-1)
+        return np.asarray(self.position, dtype=float) + np.cumsum(offsets, axis=-2)
 
-        for i in range(self.N):
-            current_pendulum_position[0] += self.rod_lengths[i] * np.cos(self.thetas[i])
-            current_pendulum_position[1] += self.rod_lengths[i] * np.sin(self.thetas[i])
-            self.pendulum_positions.append(current_pendulum_position.copy())
+    def update_pendulum_positions(self):
+        self.pendulum_positions = self.positions_from_thetas(self.thetas)
+        self.positions_stale = False
 
     def get_positions(self):
+        # Positions are only recomputed when something asks for them after a state change.
+        if self.positions_stale:
+            self.update_pendulum_positions()
         return self.pendulum_positions
 
+    def get_render_positions(self):
+        # Drawing may use an interpolated render_state; trackers and everything else see the true state.
+        if self.render_state is None:
+            return self.get_positions()
+        return self.positions_from_thetas(self.render_state[..., :self.N])
+
     def draw(self, screen):
+        import pygame
+
+        pendulum_positions = self.get_render_positions()
+
         pygame.draw.line(
                 screen,
-                COLORS["white"],
-                (             self.position[0],              self.position[1]),
-                (self.pendulum_positions[0][0], self.pendulum_positions[0][1]),
+                self.color,
+                (        self.position[0],         self.position[1]),
+                (pendulum_positions[0][0], pendulum_positions[0][1]),
                 1
             )
 
         for i in range(self.N-1):
             pygame.draw.line(
                 screen,
-                COLORS["white"],
-                (self.pendulum_positions[i  ][0], self.pendulum_positions[i  ][1]),
-                (self.pendulum_positions[i+1][0], self.pendulum_positions[i+1][1]),
+                self.color,
+                (pendulum_positions[i  ][0], pendulum_positions[i  ][1]),
+                (pendulum_positions[i+1][0], pendulum_positions[i+1][1]),
                 1
             )
 
         for i in range(self.N):
-            pygame.draw.circle(screen, COLORS["white"], self.pendulum_positions[i], 5)
+            pygame.draw.circle(screen, self.color, pendulum_positions[i], 5)
 
     def get_state(self):
         return np.concatenate([self.thetas, self.thetadots])
@@ -118,45 +324,331 @@ class MultiPendulum:
     def set_state(self, new_state, t):
         self.thetas = new_state[:self.N]
         self.thetadots = new_state[self.N:]
-        self.update_pendulum_positions()
+        self.positions_stale = True
+        self.render_state = None
         self.update_trackers(t)
 
-    def update_trackers(self, t):
-        for tracker in self.trackers:
-            tracker.update(t)
+    def get_kinetic_energy(self, state=None):
+        # Works on the current state, or on any array of states with the state along the last axis.
+        state = self.get_state() if state is None else np.asarray(state, dtype=float)
+        if self.backend == "numba" and self.dynamics == "dense" and state.ndim == 1:
+            return kernels.multipendulum_kinetic_energy(state, self.mass_length_matrix)
+        if self.backend == "numba" and self.dynamics == "dense" and state.ndim == 2:
+            return kernels.multipendulum_kinetic_energy_batch(state, self.mass_length_matrix)
 
-    def attach_tracker(self, tracker):
-        if tracker in self.trackers:
+        N = self.N
+        thetas    = state[..., :N]
+        thetadots = state[..., N:]
+
+        if self.dynamics == "recursive":
+            # Bob velocities are running sums of each rod's L_j thetadot_j (-sin theta_j, cos theta_j), so T = 1/2 sum m_k |v_k|^2 in O(N).
+            rod_speeds = self.rod_length_array * thetadots
+            velocities_x = np.cumsum(-np.sin(thetas) * rod_speeds, axis=-1)
+            velocities_y = np.cumsum( np.cos(thetas) * rod_speeds, axis=-1)
+            return 0.5 * np.sum(self.mass_array * (velocities_x**2 + velocities_y**2), axis=-1)
+
+        # T = 1/2 thetadots^T A thetadots with A[j][k] = mass_length_matrix[j][k] * cos(theta_j - theta_k). Expanding
+        # the cosine splits A into two rank-one-weighted quadratic forms, so no N x N cosine table is needed.
+        cos_velocities = np.cos(thetas) * thetadots
+        sin_velocities = np.sin(thetas) * thetadots
+        if state.ndim == 1:
+            return 0.5 * float(cos_velocities @ self.mass_length_matrix @ cos_velocities + sin_velocities @ self.mass_length_matrix @ sin_velocities)
+        return 0.5 * (np.einsum("...j,jk,...k->...", cos_velocities, self.mass_length_matrix, cos_velocities)
+                    + np.einsum("...j,jk,...k->...", sin_velocities, self.mass_length_matrix, sin_velocities))
+
+    def get_potential_energy(self, state=None):
+        thetas = self.thetas if state is None else np.asarray(state, dtype=float)[..., :self.N]
+        return -np.sin(thetas) @ self.gravity_coefficients
+
+    def get_total_energy(self, state=None):
+        state = self.get_state() if state is None else np.asarray(state, dtype=float)
+        return self.get_kinetic_energy(state) + self.get_potential_energy(state)
+
+class MultiPendulumEnsemble(MultiPendulum):
+    def __init__(self, thetas, thetadots, rod_lengths, masses, position, damping_coefficient=0.0, backend="numpy", dynamics="dense"):
+        self.initial_thetas = np.array(thetas, dtype=float)
+        self.initial_thetadots = np.array(thetadots, dtype=float)
+        self.thetas = self.initial_thetas.copy()
+        self.thetadots = self.initial_thetadots.copy()
+        self.rod_lengths = rod_lengths
+        self.masses = masses
+        self.position = position
+        self.damping_coefficient = damping_coefficient
+        self.M, self.N = self.thetas.shape
+        self.mass_suffix_sums = self.precompute_mass_suffix_sums()
+        self.set_dynamics(dynamics)
+        self.set_backend(backend)
+        self.update_pendulum_positions()
+        self.trackers = []
+        self.color = COLORS["white"]
+        self.render_state = None
+
+    @classmethod
+    def from_pendulum(cls, pendulum, theta_offsets, thetadot_offsets=None):
+        theta_offsets = np.asarray(theta_offsets, dtype=float)
+        if theta_offsets.ndim == 1:
+            theta_offsets = np.repeat(theta_offsets[:, None], pendulum.N, axis=1)
+        thetadot_offsets = np.zeros_like(theta_offsets) if thetadot_offsets is None else np.asarray(thetadot_offsets, dtype=float)
+
+        return cls(
+            thetas=np.asarray(pendulum.thetas, dtype=float) + theta_offsets,
+            thetadots=np.asarray(pendulum.thetadots, dtype=float) + thetadot_offsets,
+            rod_lengths=pendulum.rod_lengths,
+            masses=pendulum.masses,
+            position=pendulum.position,
+            damping_coefficient=pendulum.damping_coefficient,
+            backend=pendulum.backend,
+            dynamics=pendulum.dynamics
+        )
+
+    def precompute_derivative_buffers(self):
+        super().precompute_derivative_buffers()
+        if self.dynamics != "dense":
             return
+        M, N = self.M, self.N
+        self._angle_differences = np.empty((M, N, N))
+        self._cos_differences   = np.empty((M, N, N))
+        self._sin_differences   = np.empty((M, N, N))
+        self._A                 = np.empty((M, N, N))
+        self._b                 = np.empty((M, N))
 
-        self.trackers.append(tracker)
+    def get_damping_coefficients(self):
+        return np.ascontiguousarray(np.broadcast_to(np.asarray(self.damping_coefficient, dtype=float), (self.M,)))
 
-    def set_damping_coefficient(self, damping_coefficient):
+    def numba_rk4_step(self, t, state, dt):
+        return kernels.multipendulum_rk4_step_batch(state, dt, self.mass_length_matrix, self.gravity_coefficients, self.get_damping_coefficients())
+
+    def derivative_func(self, t, state):
+        if self.dynamics == "recursive":
+            if self.backend == "numba":
+                return kernels.multipendulum_chain_derivative_batch(state, self.rod_length_array, self.mass_array, g, self.get_damping_coefficients())
+            return self.recursive_derivative(state)
+        if self.backend == "numba":
+            return kernels.multipendulum_derivative_batch(state, self.mass_length_matrix, self.gravity_coefficients, self.get_damping_coefficients())
+
+        N = self.N
+        thetas    = state[:, :N]
+        thetadots = state[:, N:]
+
+        # Same system as MultiPendulum.derivative_func, stacked along the first axis.
+        np.subtract(thetas[:, None, :], thetas[:, :, None], out=self._angle_differences)
+        np.cos(self._angle_differences, out=self._cos_differences)
+        np.sin(self._angle_differences, out=self._sin_differences)
+
+        A = np.multiply(self.mass_length_matrix, self._cos_differences, out=self._A)
+        np.multiply(self.mass_length_matrix, self._sin_differences, out=self._sin_differences)
+        b = np.einsum("mnj,mj->mn", self._sin_differences, thetadots * thetadots, out=self._b)
+        b += self.gravity_coefficients * np.cos(thetas)
+
+        undamped_thetaddots = np.linalg.solve(A, b[..., None])[..., 0]
+
+        damping_coefficients = np.asarray(self.damping_coefficient, dtype=float).reshape(-1, 1)
+        thetaddots = undamped_thetaddots - damping_coefficients * thetadots
+
+        return np.concatenate([thetadots, thetaddots], axis=1)
+
+    def draw(self, screen):
+        import pygame
+
+        pendulum_positions = self.get_render_positions()
+        for m in range(self.M):
+            points = [self.position] + pendulum_positions[m].tolist()
+            pygame.draw.lines(screen, self.color, False, points, 1)
+
+            for i in range(self.N):
+                pygame.draw.circle(screen, self.color, points[i+1], 5)
+
+    def get_state(self):
+        return np.concatenate([self.thetas, self.thetadots], axis=1)
+
+    def get_initial_state(self):
+        return np.concatenate([self.initial_thetas, self.initial_thetadots], axis=1)
+
+    def set_state(self, new_state, t):
+        self.thetas = new_state[:, :self.N]
+        self.thetadots = new_state[:, self.N:]
+        self.positions_stale = True
+        self.render_state = None
+        self.update_trackers(t)
+
+class DynamicSystem(TrackedSystem):
+    # Generic system described by a symbolic Lagrangian. Subclasses name their generalized coordinates and
+    # parameters and return SymPy expressions from kinetic_energy, potential_energy and positions; codegen.py
+    # turns those into cached NumPy kernels. States are [coordinates, velocities], optionally batched.
+    coordinate_names = []
+    parameter_names = []
+
+    def __init__(self, coordinates, velocities, parameters, position, damping_coefficient=0.0):
+        self.kernels = codegen.load_kernels(type(self))
+        self.N = len(self.coordinate_names)
+        self.initial_coordinates = np.array(coordinates, dtype=float)
+        self.initial_velocities = np.array(velocities, dtype=float)
+        self.coordinates = self.initial_coordinates.copy()
+        self.velocities = self.initial_velocities.copy()
+        self.parameters = tuple(float(parameters[name]) for name in self.parameter_names)
+        self.position = position
         self.damping_coefficient = damping_coefficient
+        self.backend = "numpy"
+        self.positions_stale = True
+        self.trackers = []
+        self.render_state = None
+
+    @staticmethod
+    def kinetic_energy(q, qd, p):
+        raise NotImplementedError
+
+    @staticmethod
+    def potential_energy(q, p):
+        raise NotImplementedError
+
+    @staticmethod
+    def positions(q, p):
+        raise NotImplementedError
+
+    def get_damping_coefficients(self, ndim):
+        damping_coefficients = np.asarray(self.damping_coefficient, dtype=float)
+        return damping_coefficients.reshape(damping_coefficients.shape + (1,) * ndim)
+
+    def derivative_func(self, t, state):
+        N = self.N
+        q  = state[..., :N]
+        qd = state[..., N:]
 
-    def get_kinetic_energy(self):
-        kinetic_energy = 0
+        qdd = np.linalg.solve(self.kernels.mass_matrix(q, self.parameters), self.kernels.forces(q, qd, self.parameters)[..., None])[..., 0]
+        qdd = qdd - self.get_damping_coefficients(1) * qd
 
-        for j in range(self.N):
-            kinetic_energy += self.mass_suffix_sums[j] * (self.rod_lengths[j] * self.thetadots[j]) ** 2
+        return np.concatenate([qd, qdd], axis=-1)
 
-        kinetic_energy *= 0.5
+    def jacobian_func(self, t, state):
+        N = self.N
+        q  = state[..., :N]
+        qd = state[..., N:]
+        identity = np.eye(N)
+
+        M = self.kernels.mass_matrix(q, self.parameters)
+        undamped_qdd = np.linalg.solve(M, self.kernels.forces(q, qd, self.parameters)[..., None])[..., 0]
+
+        # Differentiating M @ qdd = forces gives M @ d(qdd) = d(forces) - dM @ qdd
+        rhs = self.kernels.force_jacobian(q, qd, self.parameters)
+        mass_matrix_derivatives = self.kernels.mass_matrix_derivatives(q, self.parameters)
+        rhs[..., :N] -= np.einsum("...kij,...j->...ik", mass_matrix_derivatives, undamped_qdd)
+        derivatives = np.linalg.solve(M, rhs)
+
+        J = np.zeros(state.shape[:-1] + (2*N, 2*N))
+        J[..., :N, N:] = identity
+        J[..., N:, :N] = derivatives[..., :N]
+        J[..., N:, N:] = derivatives[..., N:] - self.get_damping_coefficients(2) * identity
+
+        return J
+
+    def mass_matrix(self, q):
+        return self.kernels.mass_matrix(q, self.parameters)
 
-        for j in range(self.N):
-            for k in range(j+1, self.N):
-                kinetic_energy += self.mass_suffix_sums[k] * self.rod_lengths[j] * self.rod_lengths[k] * self.thetadots[j] * self.thetadots[k] * np.cos(self.thetas[j] - self.thetas[k])
+    def momentum_derivative(self, q, qd):
+        return self.kernels.lagrangian_gradient(q, qd, self.parameters)
 
-        return kinetic_energy
+    def get_state(self):
+        return np.concatenate([self.coordinates, self.velocities], axis=-1)
 
-    def get_potential_energy(self):
-        potential_energy = 0
+    def get_initial_state(self):
+        return np.concatenate([self.initial_coordinates, self.initial_velocities], axis=-1)
 
-        for j in range(self.N):
-            potential_energy += self.mass_suffix_sums[j] * self.rod_lengths[j] * np.sin(self.thetas[j])
+    def set_state(self, new_state, t):
+        self.coordinates = new_state[..., :self.N]
+        self.velocities = new_state[..., self.N:]
+        self.positions_stale = True
+        self.render_state = None
+        self.update_trackers(t)
 
-        potential_energy *= -g
+    def get_positions(self):
+        if self.positions_stale:
+            self.body_positions = np.asarray(self.position, dtype=float) + self.kernels.positions(self.coordinates, self.parameters)
+            self.positions_stale = False
+        return self.body_positions
 
-        return potential_energy
+    def get_render_positions(self):
+        if self.render_state is None:
+            return self.get_positions()
+        return np.asarray(self.position, dtype=float) + self.kernels.positions(self.render_state[..., :self.N], self.parameters)
 
-    def get_total_energy(self):
-        return self.get_kinetic_energy() + self.get_potential_energy()
\ No newline at end of file
+    def draw(self, screen):
+        import pygame
+
+        body_positions = self.get_render_positions()
+        points = [self.position] + body_positions.tolist()
+        pygame.draw.lines(screen, COLORS["white"], False, points, 1)
+
+        for point in points[1:]:
+            pygame.draw.circle(screen, COLORS["white"], point, 5)
+
+    def get_kinetic_energy(self, state=None):
+        state = self.get_state() if state is None else np.asarray(state, dtype=float)
+        return self.kernels.kinetic_energy(state[..., :self.N], state[..., self.N:], self.parameters)
+
+    def get_potential_energy(self, state=None):
+        state = self.get_state() if state is None else np.asarray(state, dtype=float)
+        return self.kernels.potential_energy(state[..., :self.N], self.parameters)
+
+    def get_total_energy(self, state=None):
+        state = self.get_state() if state is None else np.asarray(state, dtype=float)
+        return self.get_kinetic_energy(state) + self.get_potential_energy(state)
+
+class SpringPendulum(DynamicSystem):
+    # Bob on a spring of rest length rest_length hanging from the pivot; theta is measured from the x axis
+    # like MultiPendulum's angles and r is the current spring length.
+    coordinate_names = ["theta", "r"]
+    parameter_names = ["mass", "stiffness", "rest_length", "g"]
+
+    @staticmethod
+    def kinetic_energy(q, qd, p):
+        theta, r = q
+        theta_dot, r_dot = qd
+        mass, stiffness, rest_length, g = p
+        return mass * (r_dot**2 + r**2 * theta_dot**2) / 2
+
+    @staticmethod
+    def potential_energy(q, p):
+        import sympy
+
+        theta, r = q
+        mass, stiffness, rest_length, g = p
+        return -mass * g * r * sympy.sin(theta) + stiffness * (r - rest_length)**2 / 2
+
+    @staticmethod
+    def positions(q, p):
+        import sympy
+
+        theta, r = q
+        return [(r * sympy.cos(theta), r * sympy.sin(theta))]
+
+class CartPole(DynamicSystem):
+    # Unactuated cart sliding on a horizontal track with a pendulum of length rod_length hinged on it.
+    coordinate_names = ["x", "theta"]
+    parameter_names = ["cart_mass", "pole_mass", "rod_length", "g"]
+
+    @staticmethod
+    def kinetic_energy(q, qd, p):
+        import sympy
+
+        x, theta = q
+        x_dot, theta_dot = qd
+        cart_mass, pole_mass, rod_length, g = p
+        bob_x_dot = x_dot - rod_length * sympy.sin(theta) * theta_dot
+        bob_y_dot = rod_length * sympy.cos(theta) * theta_dot
+        return cart_mass * x_dot**2 / 2 + pole_mass * (bob_x_dot**2 + bob_y_dot**2) / 2
+
+    @staticmethod
+    def potential_energy(q, p):
+        import sympy
+
+        x, theta = q
+        cart_mass, pole_mass, rod_length, g = p
+        return -pole_mass * g * rod_length * sympy.sin(theta)
+
+    @staticmethod
+    def positions(q, p):
+        import sympy
+
+        x, theta = q
+        cart_mass, pole_mass, rod_length, g = p
+        return [(x, 0), (x + rod_length * sympy.cos(theta), rod_length * sympy.sin(theta))]
@@ -1,25 +1,125 @@
-import pygame
-from constants import COLORS, WINDOW_WIDTH, WINDOW_HEIGHT
+import numpy as np
+from collections import deque
+from constants import COLORS, WINDOW_WIDTH, WINDOW_HEIGHT, dt
+from rendering import TextCache, decimate_columns, to_pixels
+from ringbuffer import RingBuffer
 
-pygame.init()
-_font = pygame.font.SysFont("Consolas", 14)
+_font = None
+
+def get_font():
+    global _font
+    if _font is None:
+        import pygame
+        pygame.font.init()
+        _font = pygame.font.SysFont("Consolas", 14)
+    return _font
+
+class EnergyStatistics:
+    # Running statistics of every sample since the last reset, each updated in O(1): extremes, mean and
+    # variance (Welford), and drift relative to the first sample.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.initial_energy = None
+        self.last_energy = None
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.mean = 0.0
+        self.squared_deviations = 0.0
+        self.max_abs_drift = 0.0
+
+    def update(self, energy):
+        energy = float(energy)
+        if self.count == 0:
+            self.initial_energy = energy
+
+        self.count += 1
+        self.last_energy = energy
+        self.minimum = min(self.minimum, energy)
+        self.maximum = max(self.maximum, energy)
+
+        delta = energy - self.mean
+        self.mean += delta / self.count
+        self.squared_deviations += delta * (energy - self.mean)
+
+        self.max_abs_drift = max(self.max_abs_drift, abs(self.get_drift()))
+
+    def get_variance(self):
+        return self.squared_deviations / self.count if self.count > 0 else 0.0
+
+    def get_drift(self):
+        # Relative to |E0|, or absolute when the initial energy is zero.
+        if self.count == 0:
+            return 0.0
+        scale = abs(self.initial_energy) if self.initial_energy != 0 else 1.0
+        return (self.last_energy - self.initial_energy) / scale
+
+    def get_status(self):
+        if self.count == 0:
+            return "Energy: no samples"
+        return (
+            f"Energy: {self.count} samples, last {self.last_energy:.6g}, mean {self.mean:.6g}, "
+            f"min {self.minimum:.6g}, max {self.maximum:.6g}, drift {self.get_drift():.3e}, max drift {self.max_abs_drift:.3e}"
+        )
+
+class WindowExtrema:
+    # Minimum and maximum over the samples still in the tracker's window. Monotonic deques give amortized O(1)
+    # updates: a new sample discards every older one it dominates, and eviction drops samples by time.
+    def __init__(self):
+        self.minima = deque()
+        self.maxima = deque()
+
+    def clear(self):
+        self.minima.clear()
+        self.maxima.clear()
+
+    def append(self, t, value):
+        while self.minima and self.minima[-1][1] >= value:
+            self.minima.pop()
+        self.minima.append((t, value))
+        while self.maxima and self.maxima[-1][1] <= value:
+            self.maxima.pop()
+        self.maxima.append((t, value))
+
+    def evict_before(self, t_start):
+        while self.minima and self.minima[0][0] < t_start:
+            self.minima.popleft()
+        while self.maxima and self.maxima[0][0] < t_start:
+            self.maxima.popleft()
+
+    def get_minimum(self):
+        return self.minima[0][1]
+
+    def get_maximum(self):
+        return self.maxima[0][1]
 
 class EnergyTracker:
-    def __init__(self, max_time_span=10, plot_color=None, system=None, curve_thickness=None, plot_position=None, plot_width=None, plot_height=None):
+    def __init__(self, max_time_span=10, plot_color=None, system=None, curve_thickness=None, plot_position=None, plot_width=None, plot_height=None, capacity=None, sampling_interval=0.0):
         self.system = None
         if system != None: self.attach_to_system(system)
-        self.energy_values = []
+        # Sampled at most every sampling_interval of simulated time, or once per frame when it is None.
+        self.sampling_interval = sampling_interval
+        self.last_sample_time = -np.inf
+        # Rows are [t, energy]; by default the buffer holds one time span's worth of samples.
+        sample_spacing = dt if not sampling_interval else max(sampling_interval, dt)
+        self.energy_values = RingBuffer(int(max_time_span / sample_spacing) + 2 if capacity is None else capacity, 2)
         self.max_time_span = max_time_span
+        self.statistics = EnergyStatistics()
+        self.window_extrema = WindowExtrema()
         self.trajectory_colors = COLORS["white"] if plot_color is None else plot_color
         self.trajectory_thicknesses = 1 if curve_thickness is None else curve_thickness
         self.plot_position = plot_position
         self.plot_width = plot_width
         self.plot_height = plot_height
+        self.text_cache = TextCache(get_font)
 
     def attach_to_system(self, new_system):
         if self.system == new_system:
             return
         
+        if self.system != None: self.system.detach_tracker(self)
         self.system = new_system
         if new_system != None: new_system.attach_tracker(self)
 
@@ -27,12 +127,24 @@ class EnergyTracker:
         return self.system.get_total_energy()
 
     def update(self, t):
-        new_energy_value = self.get_new()
-        self.energy_values.append([t, new_energy_value])
-        while (self.energy_values[len(self.energy_values)-1][0] - self.energy_values[0][0] > self.max_time_span):
-            self.energy_values.pop(0)
+        new_energy_value = float(self.get_new())
+        self.energy_values.append((t, new_energy_value))
+        self.energy_values.evict_older_than(self.max_time_span)
+        self.statistics.update(new_energy_value)
+        self.window_extrema.append(t, new_energy_value)
+        self.window_extrema.evict_before(self.energy_values.view()[0, 0])
+
+    def clear(self):
+        self.energy_values.clear()
+        self.statistics.reset()
+        self.window_extrema.clear()
+
+    def get_energy_values(self):
+        return self.energy_values.view()
 
     def draw(self, screen):
+        import pygame
+
         if self.plot_position is None: raise Exception("Energy tracker's plot position left unspecified.")
         if self.plot_width    is None: raise Exception("Energy tracker's plot width left unspecified."   )
         if self.plot_height   is None: raise Exception("Energy tracker's plot height left unspecified."  )
@@ -45,14 +157,16 @@ class EnergyTracker:
         pygame.draw.rect(screen, COLORS["black"], plot_rect)
         pygame.draw.rect(screen, COLORS["white"], plot_rect, 1)
 
-        t_min = self.energy_values[ 0][0]
-        t_max = self.energy_values[-1][0]
+        energy_values = self.get_energy_values()
+
+        t_min = energy_values[ 0, 0]
+        t_max = energy_values[-1, 0]
         if t_max == t_min:
             t_max = t_min + max(self.max_time_span, 1e-6)
 
-        energies = [pair[1] for pair in self.energy_values]
-        e_min = min(energies)
-        e_max = max(energies)
+        energies = energy_values[:, 1]
+        e_min = self.window_extrema.get_minimum()
+        e_max = self.window_extrema.get_maximum()
         if e_max == e_min:
             e_max = e_min + 1.0
 
@@ -60,11 +174,10 @@ class EnergyTracker:
         e_min -= pad
         e_max += pad
 
-        points = []
-        for t, e in self.energy_values:
-            x = plot_rect.left + (t - t_min) / (t_max - t_min) * (plot_rect.width - 1)
-            y = plot_rect.bottom - (e - e_min) / (e_max - e_min) * (plot_rect.height - 1)
-            points.append((int(x), int(y)))
+        # Thousands of samples share each pixel column, so the curve is reduced to the pixels it actually covers.
+        x = to_pixels(energy_values[:, 0], t_min, t_max, plot_rect.left, plot_rect.width - 1)
+        y = to_pixels(energies, e_min, e_max, plot_rect.bottom, -(plot_rect.height - 1))
+        points = decimate_columns(x, y)
 
         pygame.draw.lines(
             screen,
@@ -74,12 +187,15 @@ class EnergyTracker:
             self.trajectory_thicknesses
         )
 
-        t_min_text = _font.render(f"{t_min:.2f}", True, COLORS["white"])
-        t_max_text = _font.render(f"{t_max:.2f}", True, COLORS["white"])
-        e_min_text = _font.render(f"{e_min:.2f}", True, COLORS["white"])
-        e_max_text = _font.render(f"{e_max:.2f}", True, COLORS["white"])
+        t_min_text = self.text_cache.render(f"{t_min:.2f}", COLORS["white"])
+        t_max_text = self.text_cache.render(f"{t_max:.2f}", COLORS["white"])
+        e_min_text = self.text_cache.render(f"{e_min:.2f}", COLORS["white"])
+        e_max_text = self.text_cache.render(f"{e_max:.2f}", COLORS["white"])
 
         screen.blit(t_min_text, (plot_rect.left, plot_rect.bottom + 2))
         screen.blit(t_max_text, (plot_rect.right - t_max_text.get_width(), plot_rect.bottom + 2))
         screen.blit(e_min_text, (plot_rect.left - e_min_text.get_width() - 4, plot_rect.bottom - e_min_text.get_height()))
         screen.blit(e_max_text, (plot_rect.left - e_max_text.get_width() - 4, plot_rect.top))
+
+        drift_text = self.text_cache.render(f"drift {self.statistics.get_drift():+.2e}  max {self.statistics.max_abs_drift:.2e}", COLORS["white"])
+        screen.blit(drift_text, (plot_rect.right - drift_text.get_width() - 4, plot_rect.top + 2))
@@ -0,0 +1,201 @@
+import importlib.util
+import math
+import numpy as np
+
+# Loop-based multipendulum kernels. They are plain Python until compile_kernels() replaces each of them with
+# its Numba-compiled version, so nothing here imports Numba unless the numba backend is actually requested.
+
+def numba_available():
+    return importlib.util.find_spec("numba") is not None
+
+def multipendulum_derivative_into(state, mass_length_matrix, gravity_coefficients, damping_coefficient, out, A, b):
+    N = gravity_coefficients.shape[0]
+
+    for n in range(N):
+        b[n] = gravity_coefficients[n] * math.cos(state[n])
+        for j in range(N):
+            angle_difference = state[j] - state[n]
+            A[n, j] = mass_length_matrix[n, j] * math.cos(angle_difference)
+            b[n] += mass_length_matrix[n, j] * math.sin(angle_difference) * state[N+j] * state[N+j]
+
+    # The mass matrix is symmetric positive definite, so solve A x = b with an in-place Cholesky factorization.
+    for j in range(N):
+        total = A[j, j]
+        for k in range(j):
+            total -= A[j, k] * A[j, k]
+        A[j, j] = math.sqrt(total)
+        for i in range(j+1, N):
+            total = A[i, j]
+            for k in range(j):
+                total -= A[i, k] * A[j, k]
+            A[i, j] = total / A[j, j]
+
+    for i in range(N):
+        total = b[i]
+        for k in range(i):
+            total -= A[i, k] * b[k]
+        b[i] = total / A[i, i]
+
+    for i in range(N-1, -1, -1):
+        total = b[i]
+        for k in range(i+1, N):
+            total -= A[k, i] * b[k]
+        b[i] = total / A[i, i]
+
+    for n in range(N):
+        out[n] = state[N+n]
+        out[N+n] = b[n] - damping_coefficient * state[N+n]
+
+def multipendulum_derivative(state, mass_length_matrix, gravity_coefficients, damping_coefficient):
+    N = gravity_coefficients.shape[0]
+    out = np.empty(2*N)
+    multipendulum_derivative_into(state, mass_length_matrix, gravity_coefficients, damping_coefficient, out, np.empty((N, N)), np.empty(N))
+    return out
+
+def multipendulum_derivative_batch(states, mass_length_matrix, gravity_coefficients, damping_coefficients):
+    M, size = states.shape
+    N = size // 2
+    out = np.empty((M, size))
+    A = np.empty((N, N))
+    b = np.empty(N)
+    for m in range(M):
+        multipendulum_derivative_into(states[m], mass_length_matrix, gravity_coefficients, damping_coefficients[m], out[m], A, b)
+    return out
+
+def multipendulum_rk4_step_into(state, dt, mass_length_matrix, gravity_coefficients, damping_coefficient, out, k1, k2, k3, k4, stage, A, b):
+    size = state.shape[0]
+
+    multipendulum_derivative_into(state, mass_length_matrix, gravity_coefficients, damping_coefficient, k1, A, b)
+    for i in range(size):
+        stage[i] = state[i] + 0.5 * dt * k1[i]
+    multipendulum_derivative_into(stage, mass_length_matrix, gravity_coefficients, damping_coefficient, k2, A, b)
+    for i in range(size):
+        stage[i] = state[i] + 0.5 * dt * k2[i]
+    multipendulum_derivative_into(stage, mass_length_matrix, gravity_coefficients, damping_coefficient, k3, A, b)
+    for i in range(size):
+        stage[i] = state[i] + dt * k3[i]
+    multipendulum_derivative_into(stage, mass_length_matrix, gravity_coefficients, damping_coefficient, k4, A, b)
+
+    for i in range(size):
+        out[i] = state[i] + (dt / 6) * (k1[i] + 2 * k2[i] + 2 * k3[i] + k4[i])
+
+def multipendulum_rk4_step(state, dt, mass_length_matrix, gravity_coefficients, damping_coefficient):
+    size = state.shape[0]
+    N = size // 2
+    out = np.empty(size)
+    multipendulum_rk4_step_into(
+        state, dt, mass_length_matrix, gravity_coefficients, damping_coefficient, out,
+        np.empty(size), np.empty(size), np.empty(size), np.empty(size), np.empty(size), np.empty((N, N)), np.empty(N)
+    )
+    return out
+
+def multipendulum_rk4_step_batch(states, dt, mass_length_matrix, gravity_coefficients, damping_coefficients):
+    M, size = states.shape
+    N = size // 2
+    out = np.empty((M, size))
+    k1, k2, k3, k4, stage = np.empty(size), np.empty(size), np.empty(size), np.empty(size), np.empty(size)
+    A = np.empty((N, N))
+    b = np.empty(N)
+    for m in range(M):
+        multipendulum_rk4_step_into(states[m], dt, mass_length_matrix, gravity_coefficients, damping_coefficients[m], out[m], k1, k2, k3, k4, stage, A, b)
+    return out
+
+def multipendulum_kinetic_energy(state, mass_length_matrix):
+    N = mass_length_matrix.shape[0]
+    kinetic_energy = 0.0
+    for j in range(N):
+        kinetic_energy += 0.5 * mass_length_matrix[j, j] * state[N+j] * state[N+j]
+        for k in range(j+1, N):
+            kinetic_energy += mass_length_matrix[j, k] * state[N+j] * state[N+k] * math.cos(state[j] - state[k])
+    return kinetic_energy
+
+def multipendulum_kinetic_energy_batch(states, mass_length_matrix):
+    M = states.shape[0]
+    out = np.empty(M)
+    for m in range(M):
+        out[m] = multipendulum_kinetic_energy(states[m], mass_length_matrix)
+    return out
+
+def multipendulum_chain_derivative_into(state, rod_lengths, masses, gravity, damping_coefficient, out, diagonal, off_diagonal, eliminated, tensions):
+    # O(N) chain dynamics through the rod tensions T, which satisfy a symmetric tridiagonal system:
+    # T_k (1/m_k + 1/m_(k-1)) - T_(k+1) cos(theta_(k+1) - theta_k) / m_k - T_(k-1) cos(theta_(k-1) - theta_k) / m_(k-1)
+    #     = L_k thetadot_k^2 (+ g sin(theta_0) for the first rod)
+    N = rod_lengths.shape[0]
+
+    for k in range(N):
+        diagonal[k] = 1 / masses[k]
+        if k > 0:
+            diagonal[k] += 1 / masses[k-1]
+        if k < N-1:
+            off_diagonal[k] = -math.cos(state[k+1] - state[k]) / masses[k]
+        tensions[k] = rod_lengths[k] * state[N+k] * state[N+k]
+    tensions[0] += gravity * math.sin(state[0])
+
+    # Thomas algorithm: forward elimination into eliminated and tensions, then back substitution.
+    denominator = diagonal[0]
+    for k in range(N):
+        if k > 0:
+            denominator = diagonal[k] - off_diagonal[k-1] * eliminated[k-1]
+            tensions[k] -= off_diagonal[k-1] * tensions[k-1]
+        tensions[k] /= denominator
+        if k < N-1:
+            eliminated[k] = off_diagonal[k] / denominator
+    for k in range(N-2, -1, -1):
+        tensions[k] -= eliminated[k] * tensions[k+1]
+
+    # L_k thetaddot_k = T_(k+1) sin(theta_(k+1) - theta_k) / m_k + T_(k-1) sin(theta_(k-1) - theta_k) / m_(k-1)
+    for k in range(N):
+        if k == 0:
+            acceleration = gravity * math.cos(state[0])
+        else:
+            acceleration = tensions[k-1] * math.sin(state[k-1] - state[k]) / masses[k-1]
+        if k < N-1:
+            acceleration += tensions[k+1] * math.sin(state[k+1] - state[k]) / masses[k]
+        out[k] = state[N+k]
+        out[N+k] = acceleration / rod_lengths[k] - damping_coefficient * state[N+k]
+
+def multipendulum_chain_derivative(state, rod_lengths, masses, gravity, damping_coefficient):
+    N = rod_lengths.shape[0]
+    out = np.empty(2*N)
+    multipendulum_chain_derivative_into(state, rod_lengths, masses, gravity, damping_coefficient, out, np.empty(N), np.empty(N), np.empty(N), np.empty(N))
+    return out
+
+def multipendulum_chain_derivative_batch(states, rod_lengths, masses, gravity, damping_coefficients):
+    M, size = states.shape
+    N = size // 2
+    out = np.empty((M, size))
+    diagonal, off_diagonal, eliminated, tensions = np.empty(N), np.empty(N), np.empty(N), np.empty(N)
+    for m in range(M):
+        multipendulum_chain_derivative_into(states[m], rod_lengths, masses, gravity, damping_coefficients[m], out[m], diagonal, off_diagonal, eliminated, tensions)
+    return out
+
+KERNEL_NAMES = [
+    "multipendulum_derivative_into",
+    "multipendulum_derivative",
+    "multipendulum_derivative_batch",
+    "multipendulum_rk4_step_into",
+    "multipendulum_rk4_step",
+    "multipendulum_rk4_step_batch",
+    "multipendulum_kinetic_energy",
+    "multipendulum_kinetic_energy_batch",
+    "multipendulum_chain_derivative_into",
+    "multipendulum_chain_derivative",
+    "multipendulum_chain_derivative_batch"
+]
+
+compiled = False
+
+def compile_kernels():
+    global compiled
+    if compiled:
+        return
+    if not numba_available():
+        raise Exception("The numba backend needs Numba, which is not installed.")
+
+    from numba import njit
+
+    # Callees come before their callers in KERNEL_NAMES, so by the time a caller is compiled lazily on its
+    # first call, the globals it refers to are already Numba dispatchers.
+    for name in KERNEL_NAMES:
+        globals()[name] = njit(cache=True)(globals()[name])
+    compiled = True
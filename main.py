@@ -4,9 +4,16 @@ import numpy as np
 from keybinds import Keybinds
 from constants import WINDOW_WIDTH, WINDOW_HEIGHT, COLORS, CAPTION, dt, simulation_over_real_time_ratio, MAX_FPS
 from dynamic_systems import MultiPendulum
-from solvers import ExplicitEuler, ImplicitEuler, RK4
+from solvers import ExplicitEuler, ImplicitEuler, RK4, DormandPrince45, ImplicitMidpoint, GaussLegendre, StormerVerlet, NormalModes, get_normal_modes
 from trajectorytracker import TrajectoryTracker
 from energytracker import EnergyTracker
+from recorder import Recorder, Recording
+from checkpoints import CheckpointStore
+from scheduler import SimulationScheduler
+from simulationworker import SimulationWorker
+from profiler import Profiler
+from scene import Scene, SceneEntry
+import chaos
 from console import Console
 from consolecommands import ParameterType
 pygame.init()
@@ -28,6 +35,8 @@ def quit_game():
 def toggle_simulation():
     global simulating
     simulating = not simulating
+    if worker is not None:
+        worker.send("start" if simulating else "pause")
 
 @key_bind("t")
 def toggle_trajectories():
@@ -39,10 +48,21 @@ def toggle_console():
     global console_open
     console_open = not console_open
 
+def reset_selected_systems():
+    global current_system, t
+    for entry in selected_entries:
+        if entry is not main_entry:
+            entry.system.set_state(entry.system.get_initial_state(), t)
+            continue
+        if replay is not None:
+            t = replay.get_start_time()
+        if worker is not None:
+            worker.send("reset")
+        current_system.set_state(current_system.get_initial_state(), t)
+
 @key_bind("r")
 def reset():
-    global current_system, t
-    current_system.set_state(current_system.get_initial_state(), t)
+    reset_selected_systems()
 
 @key_bind("e")
 def toggle_energy_plot():
@@ -80,11 +100,21 @@ def cmb_bg_rgb(args):
 
 @command(command_name="show", parameter_types=[ParameterType.STRING])
 def cmd_show(args):
-    global dt, current_system, current_solver
+    global dt, current_system, current_solver, dp45_solver, ime_solver
     variable_name_to_output = {
         "damping"  : "Damping coefficient: " + str(float(current_system.damping_coefficient)),
         "stepsize" : "Stepsize: " + str(dt),
-        "solver"   : "Solver: " + str(current_solver)
+        "solver"   : "Solver: " + str(current_solver),
+        "rtol"     : "Relative tolerance: " + ", ".join(entry.name + " " + str(entry.get_solver_option("rtol")) for entry in selected_entries),
+        "atol"     : "Absolute tolerance: " + ", ".join(entry.name + " " + str(entry.get_solver_option("atol")) for entry in selected_entries),
+        "checkpoints" : "Checkpoints: " + str(len(checkpoint_store)) + " stored, " + str(checkpoint_store.interval) + " s apart",
+        "schedule" : scheduler.get_status(),
+        "backend"  : "Backend: " + current_system.backend,
+        "dynamics" : "Dynamics: " + current_system.dynamics,
+        "drift"    : current_energy_tracker.statistics.get_status(),
+        "scene"    : scene.get_status() + "; selected " + ", ".join(entry.name for entry in selected_entries),
+        "modes"    : "Normal mode frequencies " + np.array2string(get_normal_modes(multipendulum)[0], precision=3) + " rad/s, " + str(nm_solver.linear_steps) + " linear and " + str(nm_solver.nonlinear_steps) + " nonlinear steps, amplitude tolerance " + str(main_entry.solver_options.get("amplitude_tolerance", nm_solver.amplitude_tolerance)),
+        "newton"   : "Implicit Euler Newton iterations: " + str(ime_solver.last_iterations) + " last step, " + str(ime_solver.total_iterations) + " total, " + str(ime_solver.factorizations) + " factorizations, " + str(ime_solver.retries) + " refactored retries, " + str(ime_solver.fallbacks) + " unconverged steps finished by scipy root" + ("" if ime_solver.last_failure_time is None else " (last at t = " + f"{ime_solver.last_failure_time:.3f}" + ")")
     }
     if args[0] == "variablenames":
         return "Variable name list: " + str(list(variable_name_to_output.keys())) + "."
@@ -95,44 +125,415 @@ def cmd_show(args):
 @command(command_name="damping", parameter_types=[ParameterType.FLOAT])
 def cmd_set_damping(args):
     global current_system
-    current_system.set_damping_coefficient(args[0])
-    return "Damping coefficient set to " + str(args[0]) + "."
+    for entry in selected_entries:
+        entry.system.set_damping_coefficient(args[0])
+    if worker is not None and main_entry in selected_entries:
+        worker.send("damping", args[0])
+    return "Damping coefficient of " + ", ".join(entry.name for entry in selected_entries) + " set to " + str(args[0]) + "."
 
 @command(command_name="stepsize", parameter_types=[ParameterType.FLOAT])
 def cmd_set_stepsize(args):
     global dt
+    if args[0] <= 0:
+        return "Step size must be positive."
     dt = args[0]
+    if worker is not None:
+        worker.send("stepsize", args[0])
     return "Step size set to " + str(args[0]) + "."
 
 @command(command_name="solver", parameter_types=[ParameterType.STRING])
 def cmd_set_solver(args):
-    global current_solver, exe_solver, ime_solver, rk4_solver
+    global current_solver, current_solver_name, exe_solver, ime_solver, rk4_solver, dp45_solver, imp_solver, gl4_solver, sv_solver, nm_solver
     solver_name_to_output = {
-        "expliciteuler" : [exe_solver, "explicit euler"],
-        "impliciteuler" : [ime_solver, "implicit euler"],
-        "rk4"           : [rk4_solver, "RK-4"]
+        "expliciteuler"    : [exe_solver,  "explicit euler"],
+        "impliciteuler"    : [ime_solver,  "implicit euler"],
+        "rk4"              : [rk4_solver,  "RK-4"],
+        "dopri5"           : [dp45_solver, "Dormand-Prince 5(4)"],
+        "implicitmidpoint" : [imp_solver,  "implicit midpoint"],
+        "gausslegendre"    : [gl4_solver,  "Gauss-Legendre 2-stage"],
+        "verlet"           : [sv_solver,   "Stormer-Verlet"],
+        "normalmodes"      : [nm_solver,   "normal modes"]
     }
     if args[0] not in solver_name_to_output:
         return "Solver \'" + args[0] + "\' not recognized."
     output = solver_name_to_output[args[0]]
-    current_solver = output[0]
-    return "Solver set to " + output[1] + "."
+    for entry in selected_entries:
+        if entry is not main_entry:
+            entry.set_solver(args[0])
+            continue
+        current_solver = output[0]
+        current_solver_name = args[0]
+        main_entry.set_solver(args[0], current_solver)
+        if worker is not None:
+            worker.send("solver", args[0])
+    scene.invalidate()
+    return "Solver of " + ", ".join(entry.name for entry in selected_entries) + " set to " + output[1] + "."
+
+@command(command_name="backend", parameter_types=[ParameterType.STRING], description="Selects the numpy, numba or auto kernels for the current system.")
+def cmd_set_backend(args):
+    global current_system
+    try:
+        for entry in selected_entries:
+            entry.system.set_backend(args[0])
+    except Exception as error:
+        return str(error)
+    if worker is not None and main_entry in selected_entries:
+        worker.send("backend", current_system.backend)
+    scene.invalidate()
+    return "Backend of " + ", ".join(entry.name for entry in selected_entries) + " set to " + selected_entries[0].system.backend + "."
+
+@command(command_name="dynamics", parameter_types=[ParameterType.STRING], description="Selects the dense O(N^3) or recursive O(N) chain dynamics.")
+def cmd_set_dynamics(args):
+    try:
+        for entry in selected_entries:
+            entry.system.set_dynamics(args[0])
+    except Exception as error:
+        return str(error)
+    if worker is not None and main_entry in selected_entries:
+        worker.send("dynamics", args[0])
+    scene.invalidate()
+    return "Dynamics of " + ", ".join(entry.name for entry in selected_entries) + " set to " + args[0] + "."
+
+@command(command_name="rtol", parameter_types=[ParameterType.FLOAT], description="Sets the relative tolerance of the adaptive solver.")
+def cmd_set_rtol(args):
+    if args[0] <= 0:
+        return "Tolerance must be positive."
+    for entry in selected_entries:
+        entry.set_solver_option("rtol", args[0])
+    if worker is not None and main_entry in selected_entries:
+        worker.send("rtol", args[0])
+    scene.invalidate()
+    return "Relative tolerance of " + ", ".join(entry.name for entry in selected_entries) + " set to " + str(args[0]) + "."
+
+@command(command_name="atol", parameter_types=[ParameterType.FLOAT], description="Sets the absolute tolerance of the adaptive solver.")
+def cmd_set_atol(args):
+    if args[0] <= 0:
+        return "Tolerance must be positive."
+    for entry in selected_entries:
+        entry.set_solver_option("atol", args[0])
+    if worker is not None and main_entry in selected_entries:
+        worker.send("atol", args[0])
+    scene.invalidate()
+    return "Absolute tolerance of " + ", ".join(entry.name for entry in selected_entries) + " set to " + str(args[0]) + "."
+
+@command(command_name="modetolerance", parameter_types=[ParameterType.FLOAT], description="Sets the largest angle from hanging down, in radians, that the normal mode solver still treats as linear.")
+def cmd_set_mode_tolerance(args):
+    if args[0] < 0:
+        return "Tolerance must be non-negative."
+    for entry in selected_entries:
+        entry.set_solver_option("amplitude_tolerance", args[0])
+    if worker is not None and main_entry in selected_entries:
+        worker.send("amplitude_tolerance", args[0])
+    scene.invalidate()
+    return "Normal mode amplitude tolerance of " + ", ".join(entry.name for entry in selected_entries) + " set to " + str(args[0]) + "."
+
+@command(command_name="ratio", parameter_types=[ParameterType.FLOAT], description="Sets the target simulated over real time ratio.")
+def cmd_set_ratio(args):
+    if args[0] <= 0:
+        return "Ratio must be positive."
+    scheduler.ratio = args[0]
+    if worker is not None:
+        worker.send("ratio", args[0])
+    return "Target sim/real ratio set to " + str(args[0]) + "."
+
+@command(command_name="framebudget", parameter_types=[ParameterType.FLOAT], description="Sets the milliseconds of solver work allowed per frame.")
+def cmd_set_frame_budget(args):
+    if args[0] <= 0:
+        return "Frame budget must be positive."
+    scheduler.frame_budget = args[0] / 1000
+    return "Frame budget set to " + str(args[0]) + " ms."
+
+@command(command_name="lagindicator")
+def cmd_toggle_lag_indicator(args):
+    global show_lag_indicator
+    show_lag_indicator = not show_lag_indicator
+
+@command(command_name="interpolation")
+def cmd_toggle_interpolation(args):
+    global interpolate_rendering
+    interpolate_rendering = not interpolate_rendering
+    if not interpolate_rendering:
+        scene.clear_render_states()
+    return "Render interpolation " + ("on" if interpolate_rendering else "off") + "."
 
 @command(command_name="reset")
 def cmd_reset(args):
-    global current_system, t
-    current_system.set_state(current_system.get_initial_state(), t)
-    return "System reset."
+    reset_selected_systems()
+    return "Reset " + ", ".join(entry.name for entry in selected_entries) + "."
+
+@command(command_name="record", parameter_types=[ParameterType.STRING], description="Streams every solver step of the current system to a file.")
+def cmd_record(args):
+    global recorder, current_system, current_solver, dt
+    if replay is not None:
+        return "Cannot record during a replay."
+    if worker is not None:
+        return "Cannot record while the worker is running."
+    if recorder is not None:
+        recorder.attach_to_system(None)
+    try:
+        recorder = Recorder(args[0], current_system, str(current_solver), dt, t=t)
+    except OSError:
+        recorder = None
+        return "Could not open \'" + args[0] + "\' for recording."
+    return "Recording to " + args[0] + "."
+
+@command(command_name="stoprecord")
+def cmd_stop_record(args):
+    global recorder
+    if recorder is None:
+        return "Not recording."
+    recorder.attach_to_system(None)
+    rows = recorder.rows
+    recorder = None
+    return "Recording stopped after " + str(rows) + " states."
+
+@command(command_name="replay", parameter_types=[ParameterType.STRING], description="Plays a recording back without running any solver.")
+def cmd_replay(args):
+    global replay, recorder, current_system, current_trajectory_tracker, t, live_t
+    try:
+        new_replay = Recording(args[0])
+    except OSError:
+        return "Could not open \'" + args[0] + "\'."
+    except Exception as error:
+        return str(error)
+
+    if worker is not None:
+        return "Cannot replay while the worker is running."
+    if recorder is not None:
+        cmd_stop_record([])
+
+    header = new_replay.header
+    N = header["N"]
+    initial_state = new_replay.state_at(new_replay.get_start_time())
+    replay_system = MultiPendulum(
+        thetas=list(initial_state[:N]),
+        thetadots=list(initial_state[N:]),
+        rod_lengths=header["rod_lengths"],
+        masses=header["masses"],
+        position=multipendulum.position.copy(),
+        damping_coefficient=header["damping_coefficient"]
+    )
+
+    if replay is None:
+        live_t = t
+    replay = new_replay
+    current_system = replay_system
+    profiler.instrument_trackers(replay_system)
+    current_trajectory_tracker = TrajectoryTracker(
+        max_time_spans=[0]*(N-1) + [100],
+        trajectory_colors=[COLORS["gray"]]*N,
+        system=replay_system,
+        trajectory_thicknesses=[1]*(N-1) + [8],
+        sampling_interval=None
+    )
+    current_energy_tracker.clear()
+    current_energy_tracker.attach_to_system(replay_system)
+    t = replay.get_start_time()
+    scheduler.clear_backlog()
+    return "Replaying " + args[0] + " (" + str(len(replay)) + " states, " + header["solver"] + ", dt = " + str(header["dt"]) + ")."
+
+@command(command_name="stopreplay")
+def cmd_stop_replay(args):
+    global replay, current_system, current_trajectory_tracker, t
+    if replay is None:
+        return "Not replaying."
+    replay = None
+    current_trajectory_tracker.attach_to_system(None)
+    current_system = multipendulum
+    current_trajectory_tracker = multipendulum_trajectory_tracker
+    current_energy_tracker.clear()
+    current_energy_tracker.attach_to_system(multipendulum)
+    t = live_t
+    return "Replay stopped."
+
+@command(command_name="seek", parameter_types=[ParameterType.FLOAT], description="Jumps to the given simulation time, re-integrating from the nearest earlier checkpoint.")
+def cmd_seek(args):
+    global t, current_system, current_solver, dt
+    target = args[0]
+    if target < 0:
+        return "Time must be non-negative."
+
+    if replay is not None:
+        t = min(max(target, replay.get_start_time()), replay.get_end_time())
+        scheduler.clear_backlog()
+        current_system.set_state(replay.state_at(t), t)
+        return "Seeked replay to " + str(t) + "."
+
+    if recorder is not None:
+        return "Cannot seek while recording."
+    if worker is not None:
+        return "Cannot seek while the worker is running."
+
+    if target < t:
+        checkpoint = checkpoint_store.latest_at_or_before(target)
+        if checkpoint is None:
+            return "No checkpoint before " + str(target) + "."
+        t, state = checkpoint
+        checkpoint_store.truncate_after(t)
+        current_trajectory_tracker.clear()
+        current_energy_tracker.clear()
+        current_system.set_state(state, t)
+
+    scheduler.clear_backlog()
+    if current_solver.adaptive:
+        current_solver.step(current_system, t, target - t)
+        t = target
+    else:
+        while t + dt <= target:
+            current_solver.step(current_system, t, dt)
+            t += dt
+            checkpoint_store.update(t, current_system.get_state())
+        if target - t > 0:
+            current_solver.step(current_system, t, target - t)
+            t = target
+    checkpoint_store.update(t, current_system.get_state())
+
+    return "Seeked to " + str(t) + "."
+
+@command(command_name="profile", description="Toggles the profiler overlay with per-phase frame timings.")
+def cmd_toggle_profiler(args):
+    profiler.set_enabled(not profiler.enabled)
+    profiler.instrument_trackers(current_system)
+    scene.invalidate()
+    return "Profiler " + ("enabled." if profiler.enabled else "disabled.")
+
+@command(command_name="profiledump", parameter_types=[ParameterType.STRING], description="Writes the profiler's rolling per-frame stats to a CSV file.")
+def cmd_profile_dump(args):
+    if not profiler.enabled:
+        return "Profiler is not enabled."
+    try:
+        rows = profiler.dump_csv(args[0])
+    except OSError:
+        return "Could not write \'" + args[0] + "\'."
+    return "Wrote " + str(rows) + " frames to " + args[0] + "."
+
+@command(command_name="chaosmap", parameter_types=[ParameterType.STRING], description="Shows a map saved by 'physicalsystems chaos' as a .npy file, or 'off' to hide it.")
+def cmd_chaos_map(args):
+    global chaos_map_surface
+    if args[0] == "off":
+        chaos_map_surface = None
+        return "Chaos map hidden."
+    try:
+        values = np.load(args[0])
+    except (OSError, ValueError):
+        return "Could not load \'" + args[0] + "\'."
+    if values.ndim != 2:
+        return "Expected a 2-D map."
+    surface = chaos.make_surface(values, log_scale=np.nanmin(values) > 0)
+    chaos_map_surface = pygame.transform.scale(surface, (WINDOW_HEIGHT, WINDOW_HEIGHT))
+    return "Showing " + str(values.shape[1]) + "x" + str(values.shape[0]) + " map."
+
+scene_colors = [COLORS["cyan"], COLORS["magenta"], COLORS["yellow"], COLORS["green"], COLORS["red"], COLORS["blue"]]
+
+@command(command_name="addsystem", parameter_types=[ParameterType.STRING, ParameterType.FLOAT], description="Adds a copy of the main system's initial configuration with the given damping to the scene.")
+def cmd_add_system(args):
+    global selected_entries
+    if worker is not None:
+        return "Cannot add systems while the worker is running."
+    if args[0] == "all":
+        return "\'all\' is reserved for selecting every system."
+
+    color = scene_colors[(len(scene) - 1) % len(scene_colors)]
+    system = MultiPendulum(
+        thetas=list(multipendulum.initial_thetas),
+        thetadots=list(multipendulum.initial_thetadots),
+        rod_lengths=multipendulum.rod_lengths,
+        masses=multipendulum.masses,
+        position=multipendulum.position,
+        damping_coefficient=args[1],
+        backend=multipendulum.backend,
+        dynamics=multipendulum.dynamics
+    )
+    system.color = color
+    N = system.N
+    trajectory_tracker = TrajectoryTracker(
+        max_time_spans=[0]*(N-1) + [100],
+        trajectory_colors=[color]*N,
+        system=system,
+        trajectory_thicknesses=[1]*(N-1) + [4],
+        sampling_interval=None,
+        incremental=True
+    )
+    try:
+        entry = scene.add(SceneEntry(args[0], system, current_solver_name, trajectory_tracker=trajectory_tracker, solver_options=main_entry.solver_options))
+    except Exception as error:
+        trajectory_tracker.attach_to_system(None)
+        return str(error)
+    system.set_state(multipendulum.get_state().copy(), t)
+    selected_entries = [entry]
+    return "Added " + args[0] + " and selected it."
+
+@command(command_name="removesystem", parameter_types=[ParameterType.STRING], description="Removes a system added with addsystem.")
+def cmd_remove_system(args):
+    global selected_entries
+    if args[0] == main_entry.name:
+        return "The main system cannot be removed."
+    if args[0] not in scene.entries:
+        return "No system named \'" + args[0] + "\'."
+    entry = scene.remove(args[0])
+    if entry.trajectory_tracker is not None:
+        entry.trajectory_tracker.attach_to_system(None)
+    selected_entries = [selected for selected in selected_entries if selected is not entry] or [main_entry]
+    return "Removed " + args[0] + "."
+
+@command(command_name="tag", parameter_types=[ParameterType.STRING, ParameterType.STRING], description="Adds a tag to the selected systems, so that 'select <tag>' addresses them together.")
+def cmd_tag(args):
+    try:
+        entries = scene.select(args[0])
+    except Exception as error:
+        return str(error)
+    for entry in entries:
+        entry.tags.add(args[1])
+    return "Tagged " + ", ".join(entry.name for entry in entries) + " with " + args[1] + "."
+
+@command(command_name="select", parameter_types=[ParameterType.STRING], description="Chooses the systems that damping, solver, backend and reset apply to: a name, a tag or 'all'.")
+def cmd_select(args):
+    global selected_entries
+    try:
+        selected_entries = scene.select(args[0])
+    except Exception as error:
+        return str(error)
+    return "Selected " + ", ".join(entry.name for entry in selected_entries) + "."
 
 @command(command_name="start")
 def cmd_toggle_simulation(args):
     global simulating
     simulating = True
+    if worker is not None:
+        worker.send("start")
 
 @command(command_name="pause")
 def cmd_pause(args):
     global simulating
     simulating = False
+    if worker is not None:
+        worker.send("pause")
+
+@command(command_name="worker", description="Moves integration to a background process, or back into the window loop.")
+def cmd_toggle_worker(args):
+    global worker, t
+    if worker is None:
+        if replay is not None:
+            return "Cannot start the worker during a replay."
+        if recorder is not None:
+            return "Cannot start the worker while recording."
+        if len(scene) > 1:
+            return "Cannot start the worker with more than one system in the scene."
+        try:
+            worker = SimulationWorker(current_system, t, current_solver_name, dt, scheduler.ratio, main_entry.solver_options)
+        except Exception as error:
+            return str(error)
+        if simulating:
+            worker.send("start")
+        return "Simulation moved to a worker process."
+
+    latest = worker.stop()
+    worker = None
+    if latest is not None:
+        t, state = latest
+        current_system.set_state(state, t)
+    scheduler.clear_backlog()
+    return "Simulation moved back to the window loop."
 
 @command(command_name="quit")
 def cmd_quit(args):
@@ -162,7 +563,9 @@ multipendulum_trajectory_tracker = TrajectoryTracker(
     max_time_spans=[0,0,0,100],
     trajectory_colors=[COLORS["gray"]]*4,
     system=multipendulum,
-    trajectory_thicknesses=[1,2,4,8]
+    trajectory_thicknesses=[1,2,4,8],
+    sampling_interval=None,
+    incremental=True
 )
 
 multipendulum_energy_tracker = EnergyTracker(
@@ -171,7 +574,8 @@ multipendulum_energy_tracker = EnergyTracker(
     curve_thickness=1,
     plot_position=[100,100],
     plot_width=WINDOW_WIDTH//3,
-    plot_height=WINDOW_HEIGHT//4
+    plot_height=WINDOW_HEIGHT//4,
+    sampling_interval=0.05
 )
 
 current_system = multipendulum
@@ -181,22 +585,52 @@ current_energy_tracker = multipendulum_energy_tracker
 exe_solver = ExplicitEuler()
 ime_solver = ImplicitEuler()
 rk4_solver = RK4()
+dp45_solver = DormandPrince45()
+imp_solver = ImplicitMidpoint()
+gl4_solver = GaussLegendre(stages=2)
+sv_solver = StormerVerlet()
+nm_solver = NormalModes()
 current_solver = rk4_solver
+current_solver_name = "rk4"
+
+# The main system is always in the scene. Replays, recordings, checkpoints and the worker only ever involve it;
+# systems added from the console are stepped alongside it and batched with it where their structure matches.
+scene = Scene()
+main_entry = scene.add(SceneEntry("main", multipendulum, current_solver_name, current_solver, multipendulum_trajectory_tracker, multipendulum_energy_tracker))
+selected_entries = [main_entry]
 t = 0
 
+recorder = None
+replay = None
+worker = None
+
+checkpoint_store = CheckpointStore(state_size=2*multipendulum.N, interval=1.0, capacity=512)
+checkpoint_store.add(t, multipendulum.get_state())
+
 background_color = COLORS["black"]
 
 screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
 pygame.display.set_caption(CAPTION)
 clock = pygame.time.Clock()
-accumulator = 0
+scheduler = SimulationScheduler(ratio=simulation_over_real_time_ratio)
+profiler = Profiler()
+scene.profiler = profiler
+
+def advance_simulation(t_start, step_size):
+    profiler.count_step()
+    scene.step(t_start, step_size)
+    checkpoint_store.update(t_start + step_size, current_system.get_state())
 
 simulating = False
 show_trajectories = False
 show_energy_plot = False
 console_open = False
+show_lag_indicator = True
+interpolate_rendering = True
+chaos_map_surface = None
 running = True
 while running:
+    phase_start = profiler.start()
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             running = False
@@ -213,31 +647,95 @@ while running:
                     console.add_to_input_text(event.unicode)
             else:
                 key_binds.get(event.key)
-
-    frame_time = simulation_over_real_time_ratio * clock.tick(MAX_FPS) / 1000
+    profiler.stop("events", phase_start)
+
+    real_frame_time = clock.tick(MAX_FPS) / 1000
+    phase_start = profiler.start()
+
+    if simulating and worker is not None:
+        latest = worker.read_latest()
+        if latest is not None:
+            t, state = latest
+            current_system.set_state(state, t)
+        worker_error = worker.pop_error()
+        if worker_error is not None:
+            console.add_log("Worker: " + worker_error)
+            console_open = True
+            simulating = False
+
+    elif simulating:
+        scheduler.add_real_time(real_frame_time)
+
+        if replay is not None:
+            t = min(t + scheduler.accumulator, replay.get_end_time())
+            scheduler.frame_simulated_time = scheduler.accumulator
+            scheduler.clear_backlog()
+            current_system.set_state(replay.state_at(t), t)
+
+        # Adaptive solvers pick their own internal steps and sample the frame time through dense output.
+        elif all(entry.solver.adaptive for entry in scene.get_entries()):
+            t = scheduler.run_adaptive(advance_simulation, t)
+
+        else:
+            t = scheduler.run(advance_simulation, t, dt)
+
+        # Fixed steps leave up to dt of simulated time in the accumulator; drawing the states that far between the
+        # last two steps keeps the motion smooth when dt does not divide the frame time.
+        if interpolate_rendering and replay is None and dt > 0 and not all(entry.solver.adaptive for entry in scene.get_entries()):
+            scene.set_render_fraction(min(max(scheduler.accumulator / dt, 0), 1), dt)
+        else:
+            scene.clear_render_states()
+
+        scheduler.end_frame()
+    profiler.stop("solver", phase_start)
 
     if simulating:
-        accumulator += frame_time
-
-        while accumulator >= dt:
-            current_solver.step(current_system, t, dt)
-            t += dt
-            accumulator -= dt
+        phase_start = profiler.start()
+        current_system.update_frame_trackers(t)
+        scene.update_frame_trackers(t, skip=main_entry)
+        profiler.stop("trackers", phase_start)
 
     screen.fill(background_color)
 
+    if chaos_map_surface is not None:
+        screen.blit(chaos_map_surface, (WINDOW_WIDTH - WINDOW_HEIGHT, 0))
+
     if show_trajectories:
+        phase_start = profiler.start()
         current_trajectory_tracker.draw(screen)
+        profiler.stop("draw_trajectories", phase_start)
 
+    phase_start = profiler.start()
+    scene.draw(screen, show_trajectories, skip=main_entry)
     current_system.draw(screen)
+    profiler.stop("draw_system", phase_start)
 
     if show_energy_plot:
+        phase_start = profiler.start()
         current_energy_tracker.draw(screen)
+        profiler.stop("draw_energy", phase_start)
     
+    if show_lag_indicator and simulating:
+        scheduler.draw(screen, (WINDOW_WIDTH - 10, 10))
+
+    if profiler.enabled:
+        profiler.draw(screen, (10, 10))
+
     if console_open:
+        phase_start = profiler.start()
         console.draw(screen)
+        profiler.stop("draw_console", phase_start)
 
+    phase_start = profiler.start()
     pygame.display.flip()
+    profiler.stop("flip", phase_start)
+    profiler.end_frame(real_frame_time)
+
+if recorder is not None:
+    recorder.attach_to_system(None)
+
+if worker is not None:
+    worker.stop()
 
 pygame.quit()
 sys.exit()
\ No newline at end of file
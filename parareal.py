@@ -0,0 +1,137 @@
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dynamic_systems import MultiPendulum
+from solvers import solver_name_to_class
+
+# Parareal: [0, t_end] is split into time slices whose start states are first guessed serially with a cheap
+# coarse propagator G. Each iteration runs the accurate fine propagator F on every slice in parallel and then
+# sweeps the corrections forward serially:
+#     U[n+1] = G(U_new[n]) + F(U_old[n]) - G(U_old[n])
+# After k iterations the first k slices are exact, so the worst case is as slow as the serial fine solve, but
+# when G is close to F the slice boundaries converge in a few iterations.
+
+def make_config(rod_lengths, masses, damping_coefficient=0.0, backend="numpy", dynamics="dense",
+                fine_solver="rk4", fine_dt=0.001, coarse_solver="rk4", coarse_dt=0.05):
+    return {
+        "rod_lengths"         : list(rod_lengths),
+        "masses"              : list(masses),
+        "damping_coefficient" : damping_coefficient,
+        "backend"             : backend,
+        "dynamics"            : dynamics,
+        "fine_solver"         : fine_solver,
+        "fine_dt"             : fine_dt,
+        "coarse_solver"       : coarse_solver,
+        "coarse_dt"           : coarse_dt
+    }
+
+def build_system(state, config):
+    N = len(config["rod_lengths"])
+    return MultiPendulum(
+        thetas=np.array(state[:N], dtype=float),
+        thetadots=np.array(state[N:], dtype=float),
+        rod_lengths=config["rod_lengths"],
+        masses=config["masses"],
+        position=[0.0, 0.0],
+        damping_coefficient=config["damping_coefficient"],
+        backend=config["backend"],
+        dynamics=config["dynamics"]
+    )
+
+def propagate(state, t_start, t_end, solver_name, dt, config):
+    # Integrates from t_start to t_end with steps of at most dt, shortened so they end exactly on t_end.
+    # Adaptive solvers choose their own internal steps and are asked for the whole interval at once.
+    system = build_system(state, config)
+    solver = solver_name_to_class[solver_name]()
+    if solver.adaptive:
+        solver.step(system, t_start, t_end - t_start)
+        return system.get_state()
+
+    steps = max(1, int(np.ceil((t_end - t_start) / dt - 1e-9)))
+    step_size = (t_end - t_start) / steps
+    for step in range(steps):
+        solver.step(system, t_start + step * step_size, step_size)
+    return system.get_state()
+
+def fine(state, t_start, t_end, config):
+    return propagate(state, t_start, t_end, config["fine_solver"], config["fine_dt"], config)
+
+def coarse(state, t_start, t_end, config):
+    return propagate(state, t_start, t_end, config["coarse_solver"], config["coarse_dt"], config)
+
+def serial_fine(initial_state, t_end, config):
+    start = time.perf_counter()
+    state = fine(np.asarray(initial_state, dtype=float), 0.0, t_end, config)
+    return state, time.perf_counter() - start
+
+def parareal(initial_state, t_end, slices, config, tolerance=1e-8, max_iterations=None, workers=None):
+    # Iterates until no slice boundary state changes by more than tolerance. Returns the boundary times and
+    # states along with the iteration count, the largest change after each iteration and the timings.
+    max_iterations = slices if max_iterations is None else min(max_iterations, slices)
+    workers = os.cpu_count() if workers is None else workers
+    times = np.linspace(0.0, t_end, slices + 1)
+
+    start = time.perf_counter()
+    states = np.empty((slices + 1, len(initial_state)))
+    states[0] = initial_state
+    coarse_states = np.empty_like(states)
+    for n in range(slices):
+        coarse_states[n + 1] = coarse(states[n], times[n], times[n + 1], config)
+        states[n + 1] = coarse_states[n + 1]
+    coarse_time = time.perf_counter() - start
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    changes = []
+    fine_time = 0.0
+    iterations = 0
+    try:
+        # Slices before `exact` already start from fine-accurate states and are not recomputed.
+        for exact in range(max_iterations):
+            iterations += 1
+            phase_start = time.perf_counter()
+            pending = range(exact, slices)
+            if executor is None:
+                fine_states = [fine(states[n], times[n], times[n + 1], config) for n in pending]
+            else:
+                fine_states = list(executor.map(fine, states[exact:slices], times[exact:slices], times[exact + 1:], [config] * len(pending)))
+            fine_time += time.perf_counter() - phase_start
+
+            phase_start = time.perf_counter()
+            new_states = states.copy()
+            new_states[exact + 1] = fine_states[0]
+            for n in range(exact + 1, slices):
+                new_coarse = coarse(new_states[n], times[n], times[n + 1], config)
+                new_states[n + 1] = new_coarse + fine_states[n - exact] - coarse_states[n + 1]
+                coarse_states[n + 1] = new_coarse
+            coarse_time += time.perf_counter() - phase_start
+
+            change = float(np.max(np.abs(new_states - states)))
+            states = new_states
+            changes.append(change)
+            if change <= tolerance:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return {
+        "times"       : times,
+        "states"      : states,
+        "iterations"  : iterations,
+        "changes"     : changes,
+        "coarse_time" : coarse_time,
+        "fine_time"   : fine_time,
+        "elapsed"     : time.perf_counter() - start
+    }
+
+def format_report(result, serial_state=None, serial_time=None):
+    lines = [
+        "Parareal: " + str(result["iterations"]) + " iterations over " + str(len(result["times"]) - 1) + " slices in " + f"{result['elapsed']:.3f}" + " s"
+        + " (fine " + f"{result['fine_time']:.3f}" + " s, coarse " + f"{result['coarse_time']:.3f}" + " s).",
+        "Largest boundary change per iteration: " + ", ".join(f"{change:.2e}" for change in result["changes"]) + "."
+    ]
+    if serial_state is not None:
+        error = float(np.max(np.abs(result["states"][-1] - serial_state)))
+        lines.append("Serial fine solve: " + f"{serial_time:.3f}" + " s, speedup " + f"{serial_time / result['elapsed']:.2f}" + "x, final state difference " + f"{error:.2e}" + ".")
+    return lines
@@ -0,0 +1,242 @@
+import argparse
+import sys
+import time
+import numpy as np
+from constants import dt as default_dt
+from dynamic_systems import MultiPendulum
+from recorder import Recorder
+from solvers import Event, EventLocator, solver_name_to_class
+
+def float_list(text):
+    return [float(value) for value in text.split(",")]
+
+def int_list(text):
+    return [int(value) for value in text.split(",")]
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="physicalsystems", description="Headless simulation of the dynamic systems.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Integrates a multipendulum without opening a window.")
+    run_parser.add_argument("--steps",       type=int,        required=True)
+    run_parser.add_argument("--solver",      type=str,        default="rk4", choices=list(solver_name_to_class.keys()))
+    run_parser.add_argument("--dt",          type=float,      default=default_dt)
+    run_parser.add_argument("--thetas",      type=float_list, default=[-1.5]*4)
+    run_parser.add_argument("--thetadots",   type=float_list, default=None)
+    run_parser.add_argument("--rod-lengths", type=float_list, default=[100, 50, 25, 12])
+    run_parser.add_argument("--masses",      type=float_list, default=None)
+    run_parser.add_argument("--damping",     type=float,      default=0.0)
+    run_parser.add_argument("--backend",     type=str,        default="numpy", choices=["numpy", "numba", "auto"])
+    run_parser.add_argument("--dynamics",    type=str,        default="dense", choices=["dense", "recursive"], help="recursive solves long chains in O(N) per derivative.")
+    run_parser.add_argument("--save-every",  type=int,        default=1, help="Stores every n-th state in the output file.")
+    run_parser.add_argument("--out",         type=str,        default=None, help="Writes times and states to this .npz file.")
+    run_parser.add_argument("--record",      type=str,        default=None, help="Streams every step to this recording file (replayable in main.py).")
+    run_parser.add_argument("--event",       type=str,        default=None, choices=["flip", "pivot", "turn"],
+                            help="Locates when a link flips over the top, when its bob crosses the pivot height, or when it turns around.")
+    run_parser.add_argument("--event-link",  type=int,        default=-1, help="Index of the link the event watches, the last one by default.")
+    run_parser.add_argument("--terminate",   action="store_true", help="Stops at the first event.")
+    run_parser.set_defaults(func=run)
+
+    bench_parser = subparsers.add_parser("bench", help="Times the systems, solvers and trackers and measures work-precision.")
+    bench_parser.add_argument("--sizes",          type=int_list, default=None, help="Chain lengths N, e.g. 1,2,4,16,64.")
+    bench_parser.add_argument("--ensemble-sizes", type=int_list, default=None, help="Ensemble sizes M, e.g. 1,16,256.")
+    bench_parser.add_argument("--min-time",       type=float,    default=0.2, help="Seconds each timing loop runs for.")
+    bench_parser.add_argument("--no-work-precision", action="store_true")
+    bench_parser.add_argument("--out",            type=str,      default=None, help="Writes the results to this JSON file.")
+    bench_parser.add_argument("--compare",        type=str,      default=None, help="Baseline JSON file to compare timings against.")
+    bench_parser.set_defaults(func=bench)
+
+    chaos_parser = subparsers.add_parser("chaos", help="Maps flip times or Lyapunov exponents of the double pendulum over a (theta1, theta2) grid.")
+    chaos_parser.add_argument("quantity",      type=str,        choices=["flip", "lyapunov"])
+    chaos_parser.add_argument("--resolution",  type=int,        default=200, help="Grid points along each angle.")
+    chaos_parser.add_argument("--t-max",       type=float,      default=10.0)
+    chaos_parser.add_argument("--dt",          type=float,      default=default_dt)
+    chaos_parser.add_argument("--rod-lengths", type=float_list, default=[1.0, 1.0])
+    chaos_parser.add_argument("--masses",      type=float_list, default=[1.0, 1.0])
+    chaos_parser.add_argument("--damping",     type=float,      default=0.0)
+    chaos_parser.add_argument("--backend",     type=str,        default="numpy", choices=["numpy", "numba", "auto"])
+    chaos_parser.add_argument("--workers",     type=int,        default=None, help="Processes in the pool, defaults to the CPU count.")
+    chaos_parser.add_argument("--chunk-size",  type=int,        default=4096, help="Grid points integrated together as one ensemble.")
+    chaos_parser.add_argument("--out",         type=str,        required=True, help="A .npy file for the raw map, otherwise an image (e.g. .png).")
+    chaos_parser.set_defaults(func=chaos_map)
+
+    parareal_parser = subparsers.add_parser("parareal", help="Integrates one long multipendulum trajectory in parallel over time slices.")
+    parareal_parser.add_argument("--t-end",          type=float,      required=True)
+    parareal_parser.add_argument("--slices",         type=int,        default=None, help="Time slices, defaults to the number of workers.")
+    parareal_parser.add_argument("--fine-solver",    type=str,        default="rk4", choices=list(solver_name_to_class.keys()))
+    parareal_parser.add_argument("--fine-dt",        type=float,      default=default_dt)
+    parareal_parser.add_argument("--coarse-solver",  type=str,        default="rk4", choices=list(solver_name_to_class.keys()))
+    parareal_parser.add_argument("--coarse-dt",      type=float,      default=None, help="Defaults to 20 fine steps.")
+    parareal_parser.add_argument("--tolerance",      type=float,      default=1e-8, help="Largest change of a slice boundary state at convergence.")
+    parareal_parser.add_argument("--max-iterations", type=int,        default=None)
+    parareal_parser.add_argument("--workers",        type=int,        default=None, help="Processes in the pool, defaults to the CPU count.")
+    parareal_parser.add_argument("--thetas",         type=float_list, default=[-1.5]*4)
+    parareal_parser.add_argument("--thetadots",      type=float_list, default=None)
+    parareal_parser.add_argument("--rod-lengths",    type=float_list, default=[100, 50, 25, 12])
+    parareal_parser.add_argument("--masses",         type=float_list, default=None)
+    parareal_parser.add_argument("--damping",        type=float,      default=0.0)
+    parareal_parser.add_argument("--backend",        type=str,        default="numpy", choices=["numpy", "numba", "auto"])
+    parareal_parser.add_argument("--dynamics",       type=str,        default="dense", choices=["dense", "recursive"])
+    parareal_parser.add_argument("--no-serial",      action="store_true", help="Skips the serial fine solve the speedup is measured against.")
+    parareal_parser.add_argument("--out",            type=str,        default=None, help="Writes the slice boundary times and states to this .npz file.")
+    parareal_parser.set_defaults(func=parareal_run)
+
+    return parser
+
+def build_system(args):
+    N = len(args.thetas)
+    thetadots = [0.0]*N if args.thetadots is None else args.thetadots
+    masses = [1.0]*N if args.masses is None else args.masses
+    if len(thetadots) != N or len(args.rod_lengths) != N or len(masses) != N:
+        raise Exception("thetas, thetadots, rod lengths and masses must all have the same length.")
+
+    return MultiPendulum(
+        thetas=args.thetas,
+        thetadots=thetadots,
+        rod_lengths=args.rod_lengths,
+        masses=masses,
+        position=[0.0, 0.0],
+        damping_coefficient=args.damping,
+        backend=args.backend,
+        dynamics=args.dynamics
+    )
+
+def build_event(args, system):
+    link = args.event_link % system.N
+    N = system.N
+
+    if args.event == "flip":
+        # Hanging straight down is theta = pi/2, so a flip is the link swinging more than pi away from it.
+        return Event(lambda t, state: np.abs(state[..., link] - np.pi/2) - np.pi, direction=1, terminal=args.terminate, name="flip")
+    if args.event == "pivot":
+        rod_lengths = np.asarray(system.rod_lengths[:link+1], dtype=float)
+        return Event(lambda t, state: np.sin(state[..., :link+1]) @ rod_lengths, terminal=args.terminate, name="pivot")
+    return Event(lambda t, state: state[..., N + link], terminal=args.terminate, name="turn")
+
+def run(args):
+    system = build_system(args)
+    solver = solver_name_to_class[args.solver]()
+    event = None
+    if args.event is not None:
+        event = build_event(args, system)
+        solver = EventLocator(solver, [event])
+    dt = args.dt
+    recorder = None if args.record is None else Recorder(args.record, system, str(solver), dt)
+
+    # One extra row for the state at a terminal event between two saved steps.
+    saved_count = args.steps // args.save_every + 2
+    saved_times = np.empty(saved_count)
+    saved_states = np.empty((saved_count, 2 * system.N))
+    saved_times[0] = 0.0
+    saved_states[0] = system.get_state()
+
+    # One step on a throwaway copy first, so Numba compiling or loading its cached kernels is not timed.
+    solver_name_to_class[args.solver]().step(build_system(args), 0.0, dt)
+
+    t = 0.0
+    start = time.perf_counter()
+    steps = args.steps
+    saved = 1
+    for step in range(1, args.steps + 1):
+        solver.step(system, t, dt)
+        t += dt
+        terminated = event is not None and solver.terminated
+        if terminated:
+            t = solver.termination_time
+        if step % args.save_every == 0 or terminated:
+            saved_times[saved] = t
+            saved_states[saved] = system.get_state()
+            saved += 1
+        if terminated:
+            steps = step
+            break
+    elapsed = time.perf_counter() - start
+    saved_times = saved_times[:saved]
+    saved_states = saved_states[:saved]
+
+    if recorder is not None:
+        recorder.attach_to_system(None)
+
+    if args.out is not None:
+        np.savez(
+            args.out,
+            t=saved_times,
+            states=saved_states,
+            rod_lengths=np.asarray(system.rod_lengths, dtype=float),
+            masses=np.asarray(system.masses, dtype=float),
+            damping_coefficient=system.damping_coefficient,
+            solver=str(solver),
+            dt=dt
+        )
+
+    steps_per_second = steps / elapsed if elapsed > 0 else float("inf")
+    print(str(solver) + " (" + system.backend + ", " + system.dynamics + "): " + str(steps) + " steps in " + f"{elapsed:.3f}" + " s (" + f"{steps_per_second:.0f}" + " steps/s).")
+    print("Final energy: " + str(float(system.get_total_energy())) + ".")
+
+    if event is not None:
+        times = event.get_times()
+        print(str(len(times)) + " " + event.name + " events" + (": " + ", ".join(f"{event_time:.9f}" for event_time in times[:20]) if times else "") + ("..." if len(times) > 20 else "") + ".")
+        if event.name == "turn" and len(times) >= 3:
+            # Consecutive turning points are half a period apart.
+            print("Mean period: " + f"{2 * np.mean(np.diff(times)):.9f}" + ".")
+
+def bench(args):
+    import benchmarks
+
+    results = benchmarks.run_benchmarks(args.sizes, args.ensemble_sizes, args.min_time, not args.no_work_precision)
+    for line in benchmarks.format_results(results):
+        print(line)
+
+    if args.compare is not None:
+        print("Compared with " + args.compare + ":")
+        for line in benchmarks.compare(results, benchmarks.load_results(args.compare)):
+            print(line)
+
+    if args.out is not None:
+        benchmarks.save_results(results, args.out)
+
+def chaos_map(args):
+    import chaos
+
+    if len(args.rod_lengths) != 2 or len(args.masses) != 2:
+        raise Exception("Chaos maps are computed for the double pendulum, so give two rod lengths and two masses.")
+
+    config = chaos.make_config(args.rod_lengths, args.masses, args.damping, args.dt, args.t_max, args.backend)
+    grid = chaos.angle_grid(args.resolution)
+
+    start = time.perf_counter()
+    if args.quantity == "flip":
+        values = chaos.flip_time_map(grid, config, args.workers, args.chunk_size)
+    else:
+        values = chaos.lyapunov_map(grid, config, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - start
+
+    chaos.save_map(values, args.out, log_scale=args.quantity == "flip")
+    print(f"{grid.shape[0]}x{grid.shape[1]} {args.quantity} map in {elapsed:.2f} s ({grid.shape[0] * grid.shape[1] / elapsed:.0f} points/s)")
+
+def parareal_run(args):
+    import os
+    import parareal
+
+    system = build_system(args)
+    workers = os.cpu_count() if args.workers is None else args.workers
+    slices = workers if args.slices is None else args.slices
+    coarse_dt = 20 * args.fine_dt if args.coarse_dt is None else args.coarse_dt
+    config = parareal.make_config(system.rod_lengths, system.masses, args.damping, system.backend, args.dynamics,
+                                  args.fine_solver, args.fine_dt, args.coarse_solver, coarse_dt)
+    initial_state = system.get_state()
+
+    result = parareal.parareal(initial_state, args.t_end, slices, config, args.tolerance, args.max_iterations, workers)
+    serial_state, serial_time = (None, None) if args.no_serial else parareal.serial_fine(initial_state, args.t_end, config)
+    for line in parareal.format_report(result, serial_state, serial_time):
+        print(line)
+
+    if args.out is not None:
+        np.savez(args.out, t=result["times"], states=result["states"], changes=np.asarray(result["changes"]))
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
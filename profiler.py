@@ -0,0 +1,131 @@
+import csv
+import time
+import numpy as np
+from constants import COLORS
+from energytracker import get_font
+from ringbuffer import RingBuffer
+
+PHASES = ["events", "solver", "derivatives", "trackers", "draw_trajectories", "draw_system", "draw_energy", "draw_console", "flip"]
+
+class Profiler:
+    # Per-frame phase timings kept in a rolling window. While disabled, start() returns None and stop() does
+    # nothing, and no system is instrumented, so the main loop pays almost nothing for it.
+    def __init__(self, window=300):
+        self.enabled = False
+        self.columns = ["time", "frame_ms", "steps", "derivatives"] + [phase + "_ms" for phase in PHASES]
+        self.history = RingBuffer(window, len(self.columns))
+        self.frame_phase_times = dict.fromkeys(PHASES, 0.0)
+        self.steps = 0
+        self.derivatives = 0
+        self.fused_steps = 0
+        self.nested_time = 0.0
+        self.instrumented = []
+
+    def set_enabled(self, enabled):
+        self.uninstrument_all()
+        self.enabled = enabled
+        self.history.clear()
+
+    def is_instrumented(self, system, name):
+        return any(instrumented is system and instrumented_name == name for instrumented, instrumented_name in self.instrumented)
+
+    def add_nested_time(self, phase, elapsed):
+        # Time of instrumented calls made inside another phase goes to its own phase and out of the open one.
+        self.frame_phase_times[phase] += elapsed
+        self.nested_time += elapsed
+
+    def instrument_derivatives(self, system):
+        # Shadows the bound method with a counting and timing wrapper on the instance; uninstrument_all removes it.
+        if not self.enabled or self.is_instrumented(system, "derivative_func"):
+            return
+        derivative_func = system.derivative_func
+
+        def timed_derivative_func(t, state):
+            self.derivatives += 1
+            start = time.perf_counter()
+            derivative = derivative_func(t, state)
+            self.add_nested_time("derivatives", time.perf_counter() - start)
+            return derivative
+
+        system.derivative_func = timed_derivative_func
+        self.instrumented.append((system, "derivative_func"))
+
+    def instrument_trackers(self, system):
+        # Tracker updates run inside set_state, usually during the solver phase.
+        if not self.enabled or self.is_instrumented(system, "update_trackers"):
+            return
+        update_trackers = system.update_trackers
+
+        def timed_update_trackers(t):
+            start = time.perf_counter()
+            update_trackers(t)
+            self.add_nested_time("trackers", time.perf_counter() - start)
+
+        system.update_trackers = timed_update_trackers
+        self.instrumented.append((system, "update_trackers"))
+
+    def uninstrument_all(self):
+        for system, name in self.instrumented:
+            delattr(system, name)
+        self.instrumented = []
+
+    def start(self):
+        return (time.perf_counter(), self.nested_time) if self.enabled else None
+
+    def stop(self, phase, start):
+        if start is not None:
+            start_time, start_nested_time = start
+            elapsed = time.perf_counter() - start_time - (self.nested_time - start_nested_time)
+            self.frame_phase_times[phase] += elapsed
+
+    def count_fused_step(self):
+        # Fused kernels evaluate derivatives without going through derivative_func, so they cannot be counted.
+        self.fused_steps += 1
+
+    def count_step(self):
+        self.steps += 1
+
+    def end_frame(self, real_frame_time):
+        if not self.enabled:
+            self.steps = 0
+            self.derivatives = 0
+            self.fused_steps = 0
+            return
+
+        derivatives = np.nan if self.fused_steps > 0 else self.derivatives
+        row = [time.perf_counter(), 1000 * real_frame_time, self.steps, derivatives]
+        row += [1000 * self.frame_phase_times[phase] for phase in PHASES]
+        self.history.append(row)
+
+        self.frame_phase_times = dict.fromkeys(PHASES, 0.0)
+        self.steps = 0
+        self.derivatives = 0
+        self.fused_steps = 0
+
+    def get_summary_lines(self):
+        history = self.history.view()
+        if len(history) == 0:
+            return ["profiler: no frames yet"]
+
+        real_time = history[:, 1].sum() / 1000
+        derivatives = history[:, 3].sum()
+        derivative_rate = "      n/a" if np.isnan(derivatives) else f"{derivatives / real_time:9.0f}"
+        lines = [
+            f"frame {history[:, 1].mean():6.2f} ms   steps/s {history[:, 2].sum() / real_time:9.0f}   derivatives/s {derivative_rate}"
+        ]
+        for i, phase in enumerate(PHASES):
+            lines.append(f"{phase:<18}{history[:, 4 + i].mean():7.3f} ms")
+        return lines
+
+    def draw(self, screen, position):
+        font = get_font()
+        for i, line in enumerate(self.get_summary_lines()):
+            text = font.render(line, True, COLORS["yellow"])
+            screen.blit(text, (position[0], position[1] + 16 * i))
+
+    def dump_csv(self, path):
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.columns)
+            writer.writerows(np.asarray(self.history.view()).tolist())
+        return len(self.history)
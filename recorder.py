@@ -0,0 +1,120 @@
+import json
+import os
+import numpy as np
+
+HEADER_SIZE = 4096
+MAGIC = b"PSREC001"
+
+class Recorder:
+    # Streams [t, state...] rows into a binary file: a fixed-size header (magic + JSON metadata, zero padded)
+    # followed by raw float64 rows. Only the chunk currently being filled is mapped into memory.
+    def __init__(self, path, system=None, solver_name="", dt=0.0, chunk_size=65536, t=0.0):
+        self.path = path
+        self.solver_name = solver_name
+        self.dt = dt
+        self.chunk_size = chunk_size
+        self.sampling_interval = 0.0
+        self.last_sample_time = -np.inf
+        self.file = None
+        self.chunk = None
+        self.rows = 0
+        self.system = None
+        if system != None: self.attach_to_system(system, t)
+
+    def attach_to_system(self, new_system, t=0.0):
+        # The system's current state is written as the first row, stamped with t. Solvers report each later
+        # state with the time at the end of its step.
+        if self.system == new_system:
+            return
+
+        if self.system != None:
+            self.close()
+            self.system.detach_tracker(self)
+
+        self.system = new_system
+        if new_system != None:
+            self.open()
+            self.update(t)
+            new_system.attach_tracker(self)
+
+    def open(self):
+        self.columns = 1 + 2 * self.system.N
+        self.row_bytes = 8 * self.columns
+        self.rows = 0
+
+        header = {
+            "N"                   : self.system.N,
+            "masses"              : [float(mass) for mass in self.system.masses],
+            "rod_lengths"         : [float(rod_length) for rod_length in self.system.rod_lengths],
+            "position"            : [float(coordinate) for coordinate in self.system.position],
+            "damping_coefficient" : float(self.system.damping_coefficient),
+            "solver"              : self.solver_name,
+            "dt"                  : self.dt
+        }
+        header_bytes = MAGIC + json.dumps(header).encode("utf-8")
+        if len(header_bytes) > HEADER_SIZE:
+            raise Exception("Recording header does not fit in " + str(HEADER_SIZE) + " bytes.")
+
+        self.file = open(self.path, "wb+")
+        self.file.write(header_bytes.ljust(HEADER_SIZE, b"\0"))
+        self.file.flush()
+        self.map_next_chunk()
+
+    def map_next_chunk(self):
+        offset = HEADER_SIZE + self.rows * self.row_bytes
+        self.file.truncate(offset + self.chunk_size * self.row_bytes)
+        self.chunk = np.memmap(self.file, dtype=np.float64, mode="r+", offset=offset, shape=(self.chunk_size, self.columns))
+        self.chunk_rows = 0
+
+    def update(self, t):
+        if self.chunk_rows == self.chunk_size:
+            self.chunk.flush()
+            self.map_next_chunk()
+
+        row = self.chunk[self.chunk_rows]
+        row[0] = t
+        row[1:] = self.system.get_state()
+        self.chunk_rows += 1
+        self.rows += 1
+
+    def close(self):
+        if self.file is None:
+            return
+
+        self.chunk.flush()
+        self.chunk = None
+        self.file.truncate(HEADER_SIZE + self.rows * self.row_bytes)
+        self.file.close()
+        self.file = None
+
+class Recording:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            header_bytes = file.read(HEADER_SIZE)
+        if not header_bytes.startswith(MAGIC):
+            raise Exception("'" + path + "' is not a recording.")
+
+        self.header = json.loads(header_bytes[len(MAGIC):].rstrip(b"\0").decode("utf-8"))
+        self.N = self.header["N"]
+        columns = 1 + 2 * self.N
+        rows = (os.path.getsize(path) - HEADER_SIZE) // (8 * columns)
+        if rows == 0:
+            raise Exception("Recording '" + path + "' is empty.")
+
+        self.data = np.memmap(path, dtype=np.float64, mode="r", offset=HEADER_SIZE, shape=(rows, columns))
+        self.times = self.data[:, 0]
+        self.states = self.data[:, 1:]
+
+    def __len__(self):
+        return len(self.times)
+
+    def get_start_time(self):
+        return self.times[0]
+
+    def get_end_time(self):
+        return self.times[-1]
+
+    def state_at(self, t):
+        # Last recorded state at or before t
+        index = max(np.searchsorted(self.times, t, side="right") - 1, 0)
+        return np.array(self.states[index])
@@ -0,0 +1,112 @@
+import numpy as np
+from collections import OrderedDict
+
+def interpolate_state(previous_state, state, fraction, dt, N):
+    # States are [coordinates, velocities]. Coordinates follow the cubic Hermite through both states with the
+    # stored velocities as its slopes, so no extra derivative evaluations are needed; velocities are linear.
+    x = fraction
+    interpolated = (1 - x) * previous_state + x * state
+    interpolated[..., :N] = (
+        (1 + 2*x) * (1 - x)**2 * previous_state[..., :N] + x * (1 - x)**2 * dt * previous_state[..., N:]
+        + x**2 * (3 - 2*x) * state[..., :N] - x**2 * (1 - x) * dt * state[..., N:]
+    )
+    return interpolated
+
+class TextCache:
+    # Rendered text surfaces keyed by (text, color), so unchanged labels and log lines are rendered once.
+    # The least recently used entries are dropped once capacity is exceeded.
+    def __init__(self, font_getter, capacity=256):
+        self.font_getter = font_getter
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+
+    def render(self, text, color):
+        key = (text, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = self.font_getter().render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+def to_pixels(values, value_min, value_max, pixel_start, pixel_span):
+    # Linear map of [value_min, value_max] onto [pixel_start, pixel_start + pixel_span]; a negative span flips the axis.
+    return pixel_start + (np.asarray(values) - value_min) * (pixel_span / (value_max - value_min))
+
+def decimate_columns(x, y):
+    # Reduces a polyline whose x is non-decreasing to at most four points per pixel column (first, min, max,
+    # last), which draws the same pixels as the full line.
+    columns = np.floor(x).astype(int)
+    starts = np.flatnonzero(np.concatenate([[True], columns[1:] != columns[:-1]]))
+    if len(starts) * 4 >= len(x):
+        return np.stack([x, y], axis=-1)
+    ends = np.append(starts[1:], len(x)) - 1
+
+    decimated = np.empty((len(starts), 4, 2))
+    decimated[:, :, 0] = columns[starts, None]
+    decimated[:, 0, 1] = y[starts]
+    decimated[:, 1, 1] = np.minimum.reduceat(y, starts)
+    decimated[:, 2, 1] = np.maximum.reduceat(y, starts)
+    decimated[:, 3, 1] = y[ends]
+    return decimated.reshape(-1, 2)
+
+def decimate_path(points):
+    # Drops consecutive points that round to the same pixel as the point before them.
+    pixels = np.round(points).astype(int)
+    keep = np.concatenate([[True], np.any(pixels[1:] != pixels[:-1], axis=1)])
+    keep[-1] = True
+    return pixels[keep]
+
+class TrailLayer:
+    # Persistent transparent surface that new trail segments are drawn onto once. With fade_time set, the
+    # alpha of everything on it decays linearly to zero over that much simulated time.
+    def __init__(self, size, fade_time=None):
+        self.size = size
+        self.fade_time = fade_time
+        self.surface = None
+        self.pending_fade = 0.0
+        # Fading and blitting are limited to the area anything has been drawn on since the last clear.
+        self.dirty_rect = None
+
+    def get_surface(self):
+        if self.surface is None:
+            import pygame
+            self.surface = pygame.Surface(self.size, pygame.SRCALPHA)
+        return self.surface
+
+    def clear(self):
+        if self.surface is not None:
+            self.surface.fill((0, 0, 0, 0))
+        self.pending_fade = 0.0
+        self.dirty_rect = None
+
+    def fade(self, elapsed_time):
+        import pygame
+
+        if not self.fade_time or elapsed_time <= 0 or self.dirty_rect is None:
+            return
+        # Alpha is integral, so fractions of a step are carried over to the next frame.
+        self.pending_fade += 255 * elapsed_time / self.fade_time
+        amount = min(int(self.pending_fade), 255)
+        if amount > 0:
+            self.get_surface().fill((0, 0, 0, amount), self.dirty_rect, special_flags=pygame.BLEND_RGBA_SUB)
+            self.pending_fade -= amount
+
+    def draw_path(self, points, color, thickness):
+        import pygame
+
+        if len(points) < 2:
+            return
+        rect = pygame.draw.lines(self.get_surface(), color, False, points, thickness)
+        self.dirty_rect = rect if self.dirty_rect is None else self.dirty_rect.union(rect)
+
+    def blit(self, screen):
+        if self.dirty_rect is not None:
+            screen.blit(self.get_surface(), self.dirty_rect.topleft, self.dirty_rect)
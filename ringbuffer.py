@@ -0,0 +1,47 @@
+import numpy as np
+
+class RingBuffer:
+    # Every row is written twice, at index i and i + capacity, so the live rows always form one contiguous
+    # slice and view() never has to copy. Column 0 holds the time of each row.
+    def __init__(self, capacity, columns):
+        if capacity < 1:
+            raise Exception("Ring buffer capacity must be at least 1.")
+
+        self.capacity = capacity
+        self.columns = columns
+        self.data = np.empty((2 * capacity, columns))
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def append(self, row):
+        if self.size == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+            self.size -= 1
+
+        index = (self.start + self.size) % self.capacity
+        self.data[index] = row
+        self.data[index + self.capacity] = row
+        self.size += 1
+
+    def evict_older_than(self, time_span):
+        if self.size == 0:
+            return
+
+        t_last = self.data[self.start + self.size - 1, 0]
+        while t_last - self.data[self.start, 0] > time_span:
+            self.start = (self.start + 1) % self.capacity
+            self.size -= 1
+
+    def view(self):
+        return self.data[self.start:self.start + self.size]
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
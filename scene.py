@@ -0,0 +1,213 @@
+import numpy as np
+from rendering import interpolate_state
+from dynamic_systems import MultiPendulum, MultiPendulumEnsemble
+from solvers import solver_name_to_class
+
+# Solvers whose cost on an ensemble grows linearly with its size. The root-finding ones solve one coupled
+# system over every member, which is slower than stepping the members one by one.
+BATCHED_SOLVERS = ["expliciteuler", "impliciteuler", "rk4", "dopri5"]
+
+class SceneEntry:
+    def __init__(self, name, system, solver_name, solver=None, trajectory_tracker=None, energy_tracker=None, solver_options=None):
+        self.name = name
+        self.system = system
+        self.trajectory_tracker = trajectory_tracker
+        self.energy_tracker = energy_tracker
+        self.tags = set()
+        self.previous_state = None
+        self.stepped_state = None
+        # Tolerances set from the console, kept here so they survive solver switches and reach group solvers.
+        self.solver_options = dict(solver_options or {})
+        self.set_solver(solver_name, solver)
+
+    def set_solver(self, solver_name, solver=None):
+        if solver_name not in solver_name_to_class:
+            raise Exception("Solver \'" + solver_name + "\' not recognized.")
+        self.solver_name = solver_name
+        self.solver = solver_name_to_class[solver_name]() if solver is None else solver
+        self.apply_solver_options(self.solver)
+
+    def set_solver_option(self, name, value):
+        self.solver_options[name] = value
+        self.apply_solver_options(self.solver)
+
+    def get_solver_option(self, name):
+        # The value the entry's solvers use: set from the console, or the default of the dopri5 solver.
+        if name in self.solver_options:
+            return self.solver_options[name]
+        if hasattr(self.solver, name):
+            return getattr(self.solver, name)
+        return getattr(solver_name_to_class["dopri5"](), name, None)
+
+    def get_used_solver_options(self):
+        # Only the options the current solver has; the rest must not keep otherwise identical entries apart.
+        return {name: value for name, value in self.solver_options.items() if hasattr(self.solver, name)}
+
+    def apply_solver_options(self, solver):
+        for name, value in self.solver_options.items():
+            if hasattr(solver, name):
+                setattr(solver, name, value)
+
+class StepGroup:
+    # Entries that share a solver and everything derivative_func depends on except damping. With more than one
+    # member they are stacked into a MultiPendulumEnsemble and advanced by a single solver call per step.
+    def __init__(self, entries):
+        self.entries = entries
+        self.ensemble = None
+        if len(entries) < 2:
+            return
+
+        template = entries[0]
+        self.solver = solver_name_to_class[template.solver_name]()
+        template.apply_solver_options(self.solver)
+
+        states = np.stack([entry.system.get_state() for entry in entries])
+        N = template.system.N
+        self.ensemble = MultiPendulumEnsemble(
+            thetas=states[:, :N],
+            thetadots=states[:, N:],
+            rod_lengths=template.system.rod_lengths,
+            masses=template.system.masses,
+            position=template.system.position,
+            damping_coefficient=self.get_damping_coefficients(),
+            backend=template.system.backend,
+            dynamics=template.system.dynamics
+        )
+
+    def get_stepped_system(self):
+        return self.entries[0].system if self.ensemble is None else self.ensemble
+
+    def is_fused(self):
+        # RK4 on a compiled backend runs its stages in one kernel call, bypassing derivative_func.
+        return self.entries[0].solver_name == "rk4" and getattr(self.get_stepped_system(), "rk4_kernel", None) is not None
+
+    def get_damping_coefficients(self):
+        return np.array([float(entry.system.damping_coefficient) for entry in self.entries])
+
+    def step(self, t, dt):
+        if self.ensemble is None:
+            entry = self.entries[0]
+            entry.solver.step(entry.system, t, dt)
+            return
+
+        # Members may have been reset or re-damped since the last step, so the ensemble is refreshed from them
+        # first; unchanged states still let Dormand-Prince continue its previous step.
+        self.ensemble.damping_coefficient = self.get_damping_coefficients()
+        self.ensemble.set_state(np.stack([entry.system.get_state() for entry in self.entries]), t)
+        self.solver.step(self.ensemble, t, dt)
+
+        new_states = self.ensemble.get_state()
+        for m, entry in enumerate(self.entries):
+            entry.system.set_state(new_states[m], t + dt)
+
+class Scene:
+    def __init__(self):
+        self.entries = {}
+        self.groups = None
+        self.profiler = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        if entry.name in self.entries:
+            raise Exception("A system named \'" + entry.name + "\' already exists.")
+        self.entries[entry.name] = entry
+        self.invalidate()
+        return entry
+
+    def remove(self, name):
+        entry = self.entries.pop(name)
+        self.invalidate()
+        return entry
+
+    def get_entries(self):
+        return list(self.entries.values())
+
+    def select(self, selector):
+        # A selector is "all", the name of an entry, or a tag shared by several entries.
+        if selector == "all":
+            return self.get_entries()
+        if selector in self.entries:
+            return [self.entries[selector]]
+        tagged = [entry for entry in self.entries.values() if selector in entry.tags]
+        if not tagged:
+            raise Exception("No system or tag named \'" + selector + "\'.")
+        return tagged
+
+    def invalidate(self):
+        # Called whenever solvers, backends or membership change; groups are rebuilt on the next step.
+        self.groups = None
+
+    def get_group_key(self, entry):
+        system = entry.system
+        if type(system) is not MultiPendulum or entry.solver_name not in BATCHED_SOLVERS:
+            return None
+        return (entry.solver_name, system.backend, system.dynamics, tuple(system.rod_lengths), tuple(system.masses),
+                tuple(sorted(entry.get_used_solver_options().items())))
+
+    def build_groups(self):
+        keyed = {}
+        self.groups = []
+        for entry in self.entries.values():
+            key = self.get_group_key(entry)
+            if key is None:
+                self.groups.append(StepGroup([entry]))
+            else:
+                keyed.setdefault(key, []).append(entry)
+        self.groups += [StepGroup(entries) for entries in keyed.values()]
+
+        if self.profiler is not None:
+            for entry in self.entries.values():
+                self.profiler.instrument_trackers(entry.system)
+            for group in self.groups:
+                self.profiler.instrument_derivatives(group.get_stepped_system())
+
+    def step(self, t, dt):
+        if self.groups is None:
+            self.build_groups()
+        for entry in self.entries.values():
+            entry.previous_state = entry.system.get_state()
+        for group in self.groups:
+            group.step(t, dt)
+            if self.profiler is not None and self.profiler.enabled and group.is_fused():
+                self.profiler.count_fused_step()
+        for entry in self.entries.values():
+            entry.stepped_state = entry.system.get_state()
+
+    def set_render_fraction(self, fraction, dt):
+        # Draws each system the given fraction of the way from its state before the last step to its current one.
+        # Systems whose state was changed since (reset, seek) are drawn as they are.
+        for entry in self.entries.values():
+            system = entry.system
+            if entry.stepped_state is None or not np.array_equal(system.get_state(), entry.stepped_state):
+                system.render_state = None
+                continue
+            system.render_state = interpolate_state(entry.previous_state, entry.stepped_state, fraction, dt, system.N)
+
+    def clear_render_states(self):
+        for entry in self.entries.values():
+            entry.system.render_state = None
+
+    def draw(self, screen, show_trajectories, skip=None):
+        for entry in self.entries.values():
+            if entry is skip:
+                continue
+            if show_trajectories and entry.trajectory_tracker is not None:
+                entry.trajectory_tracker.draw(screen)
+            entry.system.draw(screen)
+
+    def update_frame_trackers(self, t, skip=None):
+        for entry in self.entries.values():
+            if entry is not skip:
+                entry.system.update_frame_trackers(t)
+
+    def get_status(self):
+        if self.groups is None:
+            self.build_groups()
+        descriptions = []
+        for group in self.groups:
+            names = ", ".join(entry.name for entry in group.entries)
+            mode = "batched" if group.ensemble is not None else "single"
+            descriptions.append("[" + names + "] " + group.entries[0].solver_name + " " + mode)
+        return "Scene: " + str(len(self.entries)) + " systems in " + str(len(self.groups)) + " step groups " + "; ".join(descriptions)
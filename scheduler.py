@@ -0,0 +1,82 @@
+import time
+from constants import COLORS
+from energytracker import get_font
+
+class SimulationScheduler:
+    # Turns real frame time into simulated time to integrate. Stepping stops once frame_budget seconds of
+    # wall time have been spent in a frame, and the backlog of unintegrated simulated time is capped at
+    # max_backlog real seconds' worth; anything beyond that is dropped, so the simulation slows down
+    # instead of freezing the window.
+    def __init__(self, ratio, frame_budget=0.02, max_backlog=0.25, smoothing=0.1, adaptive_interval=1/60):
+        self.ratio = ratio
+        self.frame_budget = frame_budget
+        self.max_backlog = max_backlog
+        self.smoothing = smoothing
+        self.adaptive_interval = adaptive_interval
+        self.accumulator = 0
+        self.dropped_time = 0
+        self.achieved_ratio = ratio
+        self.frame_real_time = 0
+        self.frame_simulated_time = 0
+
+    def add_real_time(self, real_time):
+        self.frame_real_time = real_time
+        self.frame_simulated_time = 0
+        self.accumulator += self.ratio * real_time
+
+    def run(self, step, t, step_size):
+        start = time.perf_counter()
+        while self.accumulator >= step_size:
+            step(t, step_size)
+            t += step_size
+            self.accumulator -= step_size
+            self.frame_simulated_time += step_size
+            if time.perf_counter() - start >= self.frame_budget:
+                break
+
+        self.cap_backlog()
+        return t
+
+    def run_adaptive(self, step, t):
+        # Adaptive solvers can cover any interval in one call, but the work grows with its length. The backlog is
+        # capped first and then integrated in intervals of at most adaptive_interval real seconds' worth, stopping
+        # at the frame budget like the fixed-step loop, so a slow frame cannot make the next one longer.
+        self.cap_backlog()
+        start = time.perf_counter()
+        max_interval = self.ratio * self.adaptive_interval
+        while self.accumulator > 0:
+            interval = min(self.accumulator, max_interval)
+            step(t, interval)
+            t += interval
+            self.accumulator -= interval
+            self.frame_simulated_time += interval
+            if time.perf_counter() - start >= self.frame_budget:
+                break
+
+        self.cap_backlog()
+        return t
+
+    def cap_backlog(self):
+        max_accumulator = self.ratio * self.max_backlog
+        if self.accumulator > max_accumulator:
+            self.dropped_time += self.accumulator - max_accumulator
+            self.accumulator = max_accumulator
+
+    def end_frame(self):
+        if self.frame_real_time > 0:
+            frame_ratio = self.frame_simulated_time / self.frame_real_time
+            self.achieved_ratio += self.smoothing * (frame_ratio - self.achieved_ratio)
+
+    def clear_backlog(self):
+        self.accumulator = 0
+
+    def is_lagging(self):
+        return self.achieved_ratio < 0.95 * self.ratio
+
+    def get_status(self):
+        return "Sim/real ratio: " + f"{self.achieved_ratio:.2f}" + " (target " + str(self.ratio) + "), backlog: " + f"{self.accumulator:.3f}" + " s, dropped: " + f"{self.dropped_time:.2f}" + " s"
+
+    def draw(self, screen, position):
+        color = COLORS["red"] if self.is_lagging() else COLORS["gray"]
+        text = get_font().render(f"sim/real {self.achieved_ratio:.2f}/{self.ratio}  backlog {self.accumulator:.3f} s", True, color)
+        screen.blit(text, (position[0] - text.get_width(), position[1]))
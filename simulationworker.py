@@ -0,0 +1,189 @@
+import multiprocessing
+import queue
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from dynamic_systems import MultiPendulum
+from scheduler import SimulationScheduler
+from solvers import solver_name_to_class
+
+class SharedStateBuffer:
+    # Shared-memory ring of [t, state...] rows preceded by an int64 count of published rows. The writer fills
+    # a slot and then bumps the count; readers copy the newest slot and retry if it was overwritten meanwhile.
+    def __init__(self, state_size, slots=16, shm=None):
+        self.state_size = state_size
+        self.slots = slots
+        self.columns = 1 + state_size
+        self.shm = shared_memory.SharedMemory(create=True, size=8 + 8 * slots * self.columns) if shm is None else shm
+        self.count = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self.rows = np.ndarray((slots, self.columns), dtype=np.float64, buffer=self.shm.buf, offset=8)
+        if shm is None:
+            self.count[0] = 0
+
+    def publish(self, t, state):
+        row = self.rows[self.count[0] % self.slots]
+        row[0] = t
+        row[1:] = state
+        self.count[0] += 1
+
+    def read_latest(self):
+        while True:
+            count = int(self.count[0])
+            if count == 0:
+                return None
+            row = self.rows[(count - 1) % self.slots].copy()
+            if int(self.count[0]) - count < self.slots - 1:
+                return row[0], row[1:]
+
+    def close(self, unlink=False):
+        self.count = None
+        self.rows = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+def make_solver(solver_name, solver_options):
+    solver = solver_name_to_class[solver_name]()
+    for name, value in solver_options.items():
+        if hasattr(solver, name):
+            setattr(solver, name, value)
+    return solver
+
+def run_worker(shm, state_size, slots, system_parameters, state, t, solver_name, solver_options, dt, ratio, commands, errors):
+    # Exceptions from commands or solver steps are reported on the errors queue and pause the worker, which
+    # keeps serving commands so the window can change the solver or reset instead of losing the process.
+    buffer = SharedStateBuffer(state_size, slots, shm)
+    system = MultiPendulum(**system_parameters)
+    system.set_state(state, t)
+    solver = make_solver(solver_name, solver_options)
+    scheduler = SimulationScheduler(ratio=ratio, frame_budget=0.01)
+    simulating = False
+    buffer.publish(t, system.get_state())
+
+    completed_time = [t]
+
+    def advance_simulation(t_start, step_size):
+        solver.step(system, t_start, step_size)
+        completed_time[0] = t_start + step_size
+
+    last_time = time.perf_counter()
+    while True:
+        while True:
+            try:
+                command, args = commands.get_nowait()
+            except queue.Empty:
+                break
+
+            if command == "quit":
+                buffer.close()
+                return
+            try:
+                if command == "start":
+                    simulating = True
+                elif command == "pause":
+                    simulating = False
+                elif command == "damping":
+                    system.set_damping_coefficient(args[0])
+                elif command == "solver":
+                    solver_name = args[0]
+                    solver = make_solver(solver_name, solver_options)
+                elif command in ["rtol", "atol", "amplitude_tolerance"]:
+                    solver_options[command] = args[0]
+                    solver = make_solver(solver_name, solver_options)
+                elif command == "stepsize":
+                    dt = args[0]
+                elif command == "backend":
+                    system.set_backend(args[0])
+                elif command == "dynamics":
+                    system.set_dynamics(args[0])
+                elif command == "ratio":
+                    scheduler.ratio = args[0]
+                elif command == "reset":
+                    system.set_state(system.get_initial_state(), t)
+                    buffer.publish(t, system.get_state())
+            except Exception as error:
+                errors.put("Command \'" + command + "\' failed: " + str(error))
+
+        now = time.perf_counter()
+        real_time, last_time = now - last_time, now
+
+        if not simulating:
+            time.sleep(0.005)
+            continue
+
+        scheduler.add_real_time(real_time)
+        completed_time[0] = t
+        try:
+            if solver.adaptive and scheduler.accumulator > 0:
+                t = scheduler.run_adaptive(advance_simulation, t)
+                buffer.publish(t, system.get_state())
+            elif not solver.adaptive and scheduler.accumulator >= dt > 0:
+                t = scheduler.run(advance_simulation, t, dt)
+                buffer.publish(t, system.get_state())
+            else:
+                time.sleep(0.001)
+        except Exception as error:
+            # Solvers only set the state once a step succeeds, so the system is at the end of the last completed one.
+            t = completed_time[0]
+            errors.put(str(solver) + " failed at t = " + f"{t:.6f}" + ": " + str(error) + " (simulation paused)")
+            simulating = False
+            scheduler.clear_backlog()
+            buffer.publish(t, system.get_state())
+
+class SimulationWorker:
+    # Owns a MultiPendulum and solver in a separate process. Needs the fork start method: with spawn the child
+    # would re-run main.py, which opens a window at import time.
+    def __init__(self, system, t, solver_name, dt, ratio, solver_options=None, slots=16):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise Exception("The simulation worker needs the fork start method, which this platform lacks.")
+
+        context = multiprocessing.get_context("fork")
+        self.buffer = SharedStateBuffer(2 * system.N, slots)
+        self.commands = context.Queue()
+        self.errors = context.Queue()
+        self.exit_reported = False
+        system_parameters = {
+            "thetas"              : list(system.initial_thetas),
+            "thetadots"           : list(system.initial_thetadots),
+            "rod_lengths"         : system.rod_lengths,
+            "masses"              : system.masses,
+            "position"            : list(system.position),
+            "damping_coefficient" : system.damping_coefficient,
+            "backend"             : system.backend,
+            "dynamics"            : system.dynamics
+        }
+        self.process = context.Process(
+            target=run_worker,
+            args=(self.buffer.shm, 2 * system.N, slots, system_parameters, system.get_state(), t, solver_name,
+                  dict(solver_options or {}), dt, ratio, self.commands, self.errors),
+            daemon=True
+        )
+        self.process.start()
+
+    def send(self, command, *args):
+        self.commands.put((command, args))
+
+    def read_latest(self):
+        return self.buffer.read_latest()
+
+    def pop_error(self):
+        # Returns the next error the worker reported, or a note that the process is gone, or None.
+        try:
+            return self.errors.get_nowait()
+        except queue.Empty:
+            pass
+        if not self.process.is_alive() and not self.exit_reported:
+            self.exit_reported = True
+            return "Worker process exited with code " + str(self.process.exitcode) + "."
+        return None
+
+    def stop(self):
+        self.send("quit")
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        latest = self.read_latest()
+        self.buffer.close(unlink=True)
+        self.commands.close()
+        return latest
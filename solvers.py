@@ -1,32 +1,127 @@
 import numpy as np
-from scipy.optimize import root
+from scipy.optimize import brentq, root
+from scipy.linalg import eigh, lu_factor, lu_solve
 
 class ExplicitEuler():
+    adaptive = False
+
     def step(self, system, t, dt):
         state = system.get_state()
         f = system.derivative_func
 
-        system.set_state(state + dt * f(t, state), t)
+        system.set_state(state + dt * f(t, state), t + dt)
 
     def __str__(self):
         return "Explicit Euler"
 
 class ImplicitEuler():
+    adaptive = False
+
+    def __init__(self, tolerance=1e-10, max_iterations=20, refactor_iterations=4):
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.refactor_iterations = refactor_iterations
+        self.lu = None
+        self.lu_dt = None
+        self.lu_system = None
+        self.last_iterations = 0
+        self.total_iterations = 0
+        self.factorizations = 0
+        self.retries = 0
+        self.fallbacks = 0
+        self.last_failure_time = None
+
+    def factor(self, system, t, state, dt):
+        # Newton matrix I - dt * J, frozen across iterations and across steps while it keeps converging
+        matrices = np.eye(state.shape[-1]) - dt * system.jacobian_func(t, state)
+        self.lu = lu_factor(matrices) if matrices.ndim == 2 else [lu_factor(matrix) for matrix in matrices]
+        self.lu_dt = dt
+        self.lu_system = system
+        self.factorizations += 1
+
+    def solve(self, rhs):
+        if rhs.ndim == 1:
+            return lu_solve(self.lu, rhs)
+        return np.array([lu_solve(lu, row) for lu, row in zip(self.lu, rhs)])
+
+    def newton(self, f, t, dt, state, y):
+        # Returns the last good iterate as well, so a failed attempt can be restarted from it.
+        previous_norm = np.inf
+        for iteration in range(1, self.max_iterations + 1):
+            delta = self.solve(y - state - dt*f(t + dt, y))
+            delta_norm = np.max(np.abs(delta))
+            if not np.isfinite(delta_norm) or delta_norm > previous_norm:
+                return y, False, iteration
+            y = y - delta
+
+            if delta_norm <= self.tolerance * (1 + np.max(np.abs(y))):
+                return y, True, iteration
+            previous_norm = delta_norm
+
+        return y, False, iteration
+
+    def fallback(self, system, f, t, dt, state, y):
+        # Full Newton with a fresh Jacobian at every iterate, as the solver did before the frozen Jacobian.
+        def F(y):
+            y = y.reshape(state.shape)
+            return (y - state - dt*f(t + dt, y)).ravel()
+
+        if hasattr(system, "jacobian_func") and state.ndim == 1:
+            jacobian = lambda y: np.eye(state.shape[-1]) - dt * system.jacobian_func(t + dt, y)
+            return root(F, y.ravel(), jac=jacobian).x.reshape(state.shape)
+        return root(F, y.ravel()).x.reshape(state.shape)
+
     def step(self, system, t, dt):
         state = system.get_state()
         f = system.derivative_func
 
-        def F(y):
-            return y - state - dt*f(t + dt, y)
+        if not hasattr(system, "jacobian_func"):
+            # Ensembles hold an (M, 2N) state, so the residual is solved in flattened form.
+            system.set_state(self.fallback(system, f, t, dt, state, state), t + dt)
+            return
+
+        predictor = state + dt*f(t, state)
+
+        fresh = False
+        if self.lu is None or self.lu_dt != dt or self.lu_system is not system:
+            self.factor(system, t + dt, predictor, dt)
+            fresh = True
+
+        new_state, converged, iterations = self.newton(f, t, dt, state, predictor)
+        if not converged and not fresh:
+            # The frozen Jacobian may be from an earlier step; refactor where the iteration got to and go on.
+            self.retries += 1
+            self.factor(system, t + dt, new_state, dt)
+            new_state, converged, retry_iterations = self.newton(f, t, dt, state, new_state)
+            iterations += retry_iterations
+        if not converged:
+            self.fallbacks += 1
+            self.last_failure_time = t
+            new_state = self.fallback(system, f, t, dt, state, new_state)
+            self.lu = None
 
-        system.set_state(root(F, state).x, t)
+        if iterations > self.refactor_iterations:
+            self.lu = None
+
+        self.last_iterations = iterations
+        self.total_iterations += iterations
+        system.set_state(new_state, t + dt)
 
     def __str__(self):
         return "Implicit Euler"
 
 class RK4():
+    adaptive = False
+
     def step(self, system, t, dt):
         state = system.get_state()
+
+        # Systems on a compiled backend can run all four stages in one fused kernel call.
+        kernel = getattr(system, "rk4_kernel", None)
+        if kernel is not None:
+            system.set_state(kernel(t, state, dt), t + dt)
+            return
+
         f = system.derivative_func
         
         k1 = dt*f(t,        state       )
@@ -34,7 +129,426 @@ class RK4():
         k3 = dt*f(t + dt/2, state + k2/2)
         k4 = dt*f(t + dt,   state + k3  )
 
-        system.set_state(state + (1/6) * (k1 + 2 * k2 + 2 * k3 + k4), t)
+        system.set_state(state + (1/6) * (k1 + 2 * k2 + 2 * k3 + k4), t + dt)
+
+    def __str__(self):
+        return "RK-4"
+
+class GaussLegendre():
+    adaptive = False
+
+    def __init__(self, stages=2):
+        self.stages = stages
+        nodes, weights = np.polynomial.legendre.leggauss(stages)
+        self.c = (nodes + 1) / 2
+        self.b = weights / 2
+        # Collocation conditions: sum_j a_ij c_j^(k-1) = c_i^k / k for k = 1..stages
+        powers = np.arange(1, stages + 1)
+        vandermonde = self.c[:, None] ** (powers[None, :] - 1)
+        integrals = self.c[:, None] ** powers[None, :] / powers[None, :]
+        self.a = integrals @ np.linalg.inv(vandermonde)
+
+    def step(self, system, t, dt):
+        state = system.get_state()
+        f = system.derivative_func
+        shape = (self.stages,) + state.shape
+
+        def F(K):
+            K = K.reshape(shape)
+            residual = np.empty(shape)
+            for i in range(self.stages):
+                residual[i] = K[i] - f(t + self.c[i] * dt, state + dt * np.tensordot(self.a[i], K, axes=1))
+            return residual.ravel()
+
+        K0 = np.broadcast_to(f(t, state), shape)
+        K = root(F, K0.ravel()).x.reshape(shape)
+
+        system.set_state(state + dt * np.tensordot(self.b, K, axes=1), t + dt)
 
     def __str__(self):
-        return "RK-4"
\ No newline at end of file
+        return "Gauss-Legendre " + str(self.stages) + "-stage"
+
+class ImplicitMidpoint(GaussLegendre):
+    def __init__(self):
+        super().__init__(stages=1)
+
+    def __str__(self):
+        return "Implicit Midpoint"
+
+class StormerVerlet():
+    adaptive = False
+
+    # Generalized leapfrog on the canonical momenta p = mass_matrix(thetas) @ thetadots, which keeps it
+    # symplectic for the undamped system. Damping is applied exactly as half-step velocity decays around it.
+    def step(self, system, t, dt):
+        N = system.N
+        state = system.get_state()
+        thetas, thetadots = state[..., :N], state[..., N:]
+        shape = thetas.shape
+
+        decay = np.exp(-0.5 * dt * np.asarray(system.damping_coefficient, dtype=float).reshape(-1, 1))
+        if thetas.ndim == 1:
+            decay = decay[0]
+        thetadots = decay * thetadots
+
+        def velocities(q, p):
+            return np.linalg.solve(system.mass_matrix(q), p[..., None])[..., 0]
+
+        p = (system.mass_matrix(thetas) @ thetadots[..., None])[..., 0]
+
+        def F_half_momenta(p_half):
+            p_half = p_half.reshape(shape)
+            return (p_half - p - 0.5 * dt * system.momentum_derivative(thetas, velocities(thetas, p_half))).ravel()
+
+        p_half = root(F_half_momenta, p.ravel()).x.reshape(shape)
+        v_old = velocities(thetas, p_half)
+
+        def F_thetas(q):
+            q = q.reshape(shape)
+            return (q - thetas - 0.5 * dt * (v_old + velocities(q, p_half))).ravel()
+
+        new_thetas = root(F_thetas, (thetas + dt * v_old).ravel()).x.reshape(shape)
+        v_new = velocities(new_thetas, p_half)
+        new_p = p_half + 0.5 * dt * system.momentum_derivative(new_thetas, v_new)
+        new_thetadots = decay * velocities(new_thetas, new_p)
+
+        system.set_state(np.concatenate([new_thetas, new_thetadots], axis=-1), t + dt)
+
+    def __str__(self):
+        return "Stormer-Verlet"
+
+
+class DormandPrince45():
+    adaptive = True
+
+    C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1])
+    A = [
+        [],
+        [1/5],
+        [3/40, 9/40],
+        [44/45, -56/15, 32/9],
+        [19372/6561, -25360/2187, 64448/6561, -212/729],
+        [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656]
+    ]
+    B = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84])
+    E = np.array([-71/57600, 0, 71/16695, -71/1920, 17253/339200, -22/525, 1/40])
+    # Dense output polynomial: y(t_old + x*h) = y_old + h * sum_i K_i * (P[i] @ [x, x^2, x^3, x^4])
+    P = np.array([
+        [1, -8048581381/2820520608, 8663915743/2820520608, -12715105075/11282082432],
+        [0, 0, 0, 0],
+        [0, 131558114200/32700410799, -68118460800/10900136933, 87487479700/32700410799],
+        [0, -1754552775/470086768, 14199869525/1410260304, -10690763975/1880347072],
+        [0, 127303824393/49829197408, -318862633887/49829197408, 701980252875/199316789632],
+        [0, -282668133/205662961, 2019193451/616988883, -1453857185/822651844],
+        [0, 40617522/29380423, -110615467/29380423, 69997945/29380423]
+    ])
+
+    SAFETY = 0.9
+    MIN_FACTOR = 0.2
+    MAX_FACTOR = 10
+
+    def __init__(self, rtol=1e-6, atol=1e-8):
+        self.rtol = rtol
+        self.atol = atol
+        self.system = None
+        self.accepted_steps = 0
+        self.rejected_steps = 0
+
+    def error_norm(self, x):
+        # RMS over each state, worst member for ensembles, so a batched system is held to the same tolerance
+        # as when it is stepped alone.
+        return np.sqrt(np.max(np.mean(x * x, axis=-1)))
+
+    def select_initial_step(self, f, t, y, f0):
+        scale = self.atol + np.abs(y) * self.rtol
+        d0 = self.error_norm(y / scale)
+        d1 = self.error_norm(f0 / scale)
+        h0 = 1e-6 if d0 < 1e-5 or d1 < 1e-5 else 0.01 * d0 / d1
+
+        f1 = f(t + h0, y + h0 * f0)
+        d2 = self.error_norm((f1 - f0) / scale) / h0
+        if d1 <= 1e-15 and d2 <= 1e-15:
+            h1 = max(1e-6, h0 * 1e-3)
+        else:
+            h1 = (0.01 / max(d1, d2)) ** (1/5)
+
+        return min(100 * h0, h1)
+
+    def restart(self, system, t):
+        f = system.derivative_func
+        self.system = system
+        self.t_old = self.t_new = t
+        self.y_old = self.y_new = system.get_state()
+        self.f_new = f(t, self.y_new)
+        self.h_abs = self.select_initial_step(f, t, self.y_new, self.f_new)
+        self.K = None
+
+    def is_continuing(self, system, t):
+        return (
+            self.system is system
+            and t == self.t_output
+            and np.array_equal(system.get_state(), self.y_output)
+        )
+
+    def advance(self, f):
+        t, y, h = self.t_new, self.y_new, self.h_abs
+        K = np.empty((7,) + y.shape)
+        K[0] = self.f_new
+
+        while True:
+            if t + h == t:
+                raise Exception("Dormand-Prince step size became too small at t = " + str(t) + ".")
+
+            for s in range(1, 6):
+                dy = sum(a * K[j] for j, a in enumerate(self.A[s]))
+                K[s] = f(t + self.C[s] * h, y + h * dy)
+
+            y_new = y + h * np.tensordot(self.B, K[:6], axes=1)
+            K[6] = f(t + h, y_new)
+
+            scale = self.atol + np.maximum(np.abs(y), np.abs(y_new)) * self.rtol
+            error = self.error_norm(h * np.tensordot(self.E, K, axes=1) / scale)
+
+            if error < 1:
+                factor = self.MAX_FACTOR if error == 0 else min(self.MAX_FACTOR, self.SAFETY * error ** (-1/5))
+                break
+
+            self.rejected_steps += 1
+            h *= max(self.MIN_FACTOR, self.SAFETY * error ** (-1/5))
+
+        self.accepted_steps += 1
+        self.t_old, self.y_old = t, y
+        self.t_new, self.y_new, self.f_new = t + h, y_new, K[6]
+        self.h_step = h
+        self.h_abs = h * factor
+        self.K = K
+
+    def dense_output(self, t):
+        if t == self.t_new:
+            return self.y_new
+
+        x = (t - self.t_old) / self.h_step
+        weights = self.P @ np.cumprod([x] * 4)
+        return self.y_old + self.h_step * np.tensordot(weights, self.K, axes=1)
+
+    def step(self, system, t, dt):
+        if not self.is_continuing(system, t):
+            self.restart(system, t)
+
+        t_end = t + dt
+        while self.t_new < t_end:
+            self.advance(system.derivative_func)
+
+        self.t_output = t_end
+        self.y_output = self.dense_output(t_end)
+        system.set_state(self.y_output, t + dt)
+
+    def __str__(self):
+        return "Dormand-Prince 5(4)"
+
+normal_mode_cache = {}
+
+def get_normal_modes(system):
+    # Around the hanging equilibrium (theta = pi/2) the mass matrix is mass_length_matrix and the potential's
+    # Hessian is diag(gravity_coefficients). The generalized eigenproblem K v = w^2 M v is solved once per
+    # parameter set; the M-orthonormal mode shapes V satisfy V^T M V = I.
+    key = (system.mass_length_matrix.tobytes(), system.gravity_coefficients.tobytes())
+    if key not in normal_mode_cache:
+        squared_frequencies, mode_shapes = eigh(np.diag(system.gravity_coefficients), system.mass_length_matrix)
+        normal_mode_cache[key] = (np.sqrt(squared_frequencies), mode_shapes, mode_shapes.T @ system.mass_length_matrix)
+    return normal_mode_cache[key]
+
+class NormalModes():
+    # Small oscillations of a MultiPendulum are a sum of independently damped normal modes, so while every link
+    # stays within amplitude_tolerance of hanging straight down the state at any later time is evaluated in
+    # closed form, at a cost independent of dt. Larger motions go to a Dormand-Prince fallback.
+    adaptive = True
+
+    def __init__(self, amplitude_tolerance=0.01, rtol=1e-6, atol=1e-8):
+        self.amplitude_tolerance = amplitude_tolerance
+        self.fallback = DormandPrince45(rtol, atol)
+        self.linear_steps = 0
+        self.nonlinear_steps = 0
+
+    @property
+    def rtol(self):
+        return self.fallback.rtol
+
+    @rtol.setter
+    def rtol(self, value):
+        self.fallback.rtol = value
+
+    @property
+    def atol(self):
+        return self.fallback.atol
+
+    @atol.setter
+    def atol(self, value):
+        self.fallback.atol = value
+
+    def to_modes(self, system, state):
+        frequencies, mode_shapes, projection = get_normal_modes(system)
+        N = system.N
+        # Angles are measured from the nearest hanging position, so links that have flipped before still count.
+        offsets = state[..., :N] - np.pi/2
+        displacements = (offsets + np.pi) % (2*np.pi) - np.pi
+        q  = displacements @ projection.T
+        qd = state[..., N:] @ projection.T
+        return q, qd, offsets - displacements
+
+    def is_linear(self, system, q, qd):
+        frequencies, mode_shapes, _ = get_normal_modes(system)
+        # Each mode's amplitude bounds its contribution to every link's angle for all later times.
+        amplitudes = np.sqrt(q*q + (qd / frequencies)**2)
+        return np.max(amplitudes @ np.abs(mode_shapes).T) <= self.amplitude_tolerance
+
+    def step(self, system, t, dt):
+        if not hasattr(system, "mass_length_matrix"):
+            raise Exception("Normal modes are only available for multipendulums.")
+
+        state = system.get_state()
+        q, qd, wraps = self.to_modes(system, state)
+        if not self.is_linear(system, q, qd):
+            self.nonlinear_steps += 1
+            self.fallback.step(system, t, dt)
+            return
+
+        frequencies, mode_shapes, _ = get_normal_modes(system)
+        damping_coefficients = np.asarray(system.damping_coefficient, dtype=float)
+        if state.ndim > 1:
+            damping_coefficients = damping_coefficients.reshape(-1, 1)
+        half_damping = 0.5 * damping_coefficients
+
+        # q'' + c q' + w^2 q = 0 per mode; the complex damped frequency covers the under, over and critically
+        # damped cases with one formula, sin(wd dt) / wd tending to dt as wd goes to zero.
+        damped_frequencies = np.sqrt(frequencies**2 - half_damping**2 + 0j)
+        decay = np.exp(-half_damping * dt)
+        cos_term = np.cos(damped_frequencies * dt)
+        small = np.abs(damped_frequencies) < 1e-12
+        sin_term = np.where(small, dt, np.sin(damped_frequencies * dt) / np.where(small, 1, damped_frequencies))
+
+        new_q  = np.real(decay * (q * cos_term + (qd + half_damping * q) * sin_term))
+        new_qd = np.real(decay * (qd * cos_term - (half_damping * qd + frequencies**2 * q) * sin_term))
+
+        N = system.N
+        new_state = np.empty_like(state)
+        new_state[..., :N] = np.pi/2 + wraps + new_q @ mode_shapes.T
+        new_state[..., N:] = new_qd @ mode_shapes.T
+        self.linear_steps += 1
+        system.set_state(new_state, t + dt)
+
+    def __str__(self):
+        return "Normal modes"
+
+class Event():
+    # func(t, state) returns a scalar or an array; each component that changes sign over a step is one occurrence.
+    # direction > 0 only counts rising crossings and direction < 0 only falling ones.
+    def __init__(self, func, direction=0, terminal=False, name="event"):
+        self.func = func
+        self.direction = direction
+        self.terminal = terminal
+        self.name = name
+        self.occurrences = []
+
+    def values(self, t, state):
+        return np.ravel(self.func(t, state))
+
+    def crossings(self, old_values, new_values):
+        rising  = (old_values < 0) & (new_values >= 0)
+        falling = (old_values > 0) & (new_values <= 0)
+        if self.direction > 0:
+            return rising
+        if self.direction < 0:
+            return falling
+        return rising | falling
+
+    def get_times(self):
+        return [occurrence[0] for occurrence in self.occurrences]
+
+    def clear(self):
+        self.occurrences = []
+
+class EventLocator():
+    # Wraps any solver. After each step, event components that changed sign are located inside the step with
+    # Brent's method on an interpolant of the step: the solver's dense output when it covers the step, otherwise
+    # the cubic Hermite through both endpoints and their derivatives. A terminal event moves the system back to
+    # the event time and stops all further steps until reset() is called.
+    def __init__(self, solver, events, xtol=1e-12):
+        self.solver = solver
+        self.events = events
+        self.xtol = xtol
+        self.terminated = False
+        self.termination_time = None
+
+    @property
+    def adaptive(self):
+        return self.solver.adaptive
+
+    def reset(self):
+        self.terminated = False
+        self.termination_time = None
+        for event in self.events:
+            event.clear()
+
+    def interpolant(self, system, t, dt, old_state, new_state):
+        solver = self.solver
+        if hasattr(solver, "dense_output") and solver.t_old <= t and t + dt <= solver.t_new:
+            return solver.dense_output
+
+        f = system.derivative_func
+        old_derivative = dt * f(t, old_state)
+        new_derivative = dt * f(t + dt, new_state)
+
+        def state_at(tau):
+            x = (tau - t) / dt
+            return (
+                (1 + 2*x) * (1 - x)**2 * old_state + x * (1 - x)**2 * old_derivative
+                + x**2 * (3 - 2*x) * new_state - x**2 * (1 - x) * new_derivative
+            )
+
+        return state_at
+
+    def step(self, system, t, dt):
+        if self.terminated:
+            return
+
+        old_state = system.get_state()
+        old_values = [event.values(t, old_state) for event in self.events]
+        self.solver.step(system, t, dt)
+        new_state = system.get_state()
+
+        state_at = None
+        found = []
+        for event, old in zip(self.events, old_values):
+            new = event.values(t + dt, new_state)
+            for component in np.flatnonzero(event.crossings(old, new)):
+                if state_at is None:
+                    state_at = self.interpolant(system, t, dt, old_state, new_state)
+                g = lambda tau: event.values(tau, state_at(tau))[component]
+                tau = t + dt if g(t + dt) == 0 else brentq(g, t, t + dt, xtol=self.xtol)
+                found.append((tau, event, int(component)))
+
+        terminal_times = [tau for tau, event, _ in found if event.terminal]
+        end = min(terminal_times) if terminal_times else np.inf
+        for tau, event, component in sorted(found, key=lambda occurrence: occurrence[0]):
+            if tau <= end:
+                event.occurrences.append((tau, component, state_at(tau)))
+
+        if terminal_times:
+            self.terminated = True
+            self.termination_time = end
+            system.set_state(state_at(end), end)
+
+    def __str__(self):
+        return str(self.solver)
+
+solver_name_to_class = {
+    "expliciteuler"    : ExplicitEuler,
+    "impliciteuler"    : ImplicitEuler,
+    "rk4"              : RK4,
+    "dopri5"           : DormandPrince45,
+    "implicitmidpoint" : ImplicitMidpoint,
+    "gausslegendre"    : GaussLegendre,
+    "verlet"           : StormerVerlet,
+    "normalmodes"      : NormalModes
+}
@@ -1,20 +1,34 @@
-import pygame
-from constants import COLORS
+import numpy as np
+from constants import COLORS, WINDOW_WIDTH, WINDOW_HEIGHT, dt
+from rendering import TrailLayer, decimate_path
+from ringbuffer import RingBuffer
 
 class TrajectoryTracker:
-    def __init__(self, max_time_spans, trajectory_colors=None, system=None, trajectory_thicknesses=None):
+    def __init__(self, max_time_spans, trajectory_colors=None, system=None, trajectory_thicknesses=None, capacities=None, sampling_interval=0.0, incremental=False, fade=True):
         self.system = None
         if system != None: self.attach_to_system(system)
         self.N = len(max_time_spans)
-        self.trajectories = [[] for _ in range(self.N)]
+        # Sampled at most every sampling_interval of simulated time, or once per frame when it is None.
+        self.sampling_interval = sampling_interval
+        self.last_sample_time = -np.inf
+        # Rows are [t, x, y]; by default each buffer holds one time span's worth of samples.
+        sample_spacing = dt if not sampling_interval else max(sampling_interval, dt)
+        capacities = [int(max_time_span / sample_spacing) + 2 for max_time_span in max_time_spans] if capacities is None else capacities
+        self.trajectories = [RingBuffer(capacities[i], 3) for i in range(self.N)]
         self.max_time_spans = max_time_spans
         self.trajectory_colors = [COLORS["white"]]*self.N if trajectory_colors is None else trajectory_colors
         self.trajectory_thicknesses = [1]*self.N if trajectory_thicknesses is None else trajectory_thicknesses
+        # Incremental trails only draw the segments added since the last frame, onto one persistent layer per
+        # trajectory that fades out over that trajectory's time span instead of being redrawn from the buffer.
+        self.incremental = incremental
+        self.layers = [TrailLayer((WINDOW_WIDTH, WINDOW_HEIGHT), max_time_span if fade else None) for max_time_span in max_time_spans]
+        self.drawn_until = [-np.inf]*self.N
 
     def attach_to_system(self, new_system):
         if self.system == new_system:
             return
         
+        if self.system != None: self.system.detach_tracker(self)
         self.system = new_system
         if new_system != None: new_system.attach_tracker(self)
 
@@ -24,19 +38,56 @@ class TrajectoryTracker:
     def update(self, t):
         new_positions = self.get_new()
         for i in range(self.N):
-            self.trajectories[i].append([t, new_positions[i]])
-            while self.trajectories[i][len(self.trajectories[i])-1][0] - self.trajectories[i][0][0] > self.max_time_spans[i]:
-                self.trajectories[i].pop(0)
+            self.trajectories[i].append((t, new_positions[i][0], new_positions[i][1]))
+            self.trajectories[i].evict_older_than(self.max_time_spans[i])
+
+    def clear(self):
+        for trajectory in self.trajectories:
+            trajectory.clear()
+        for layer in self.layers:
+            layer.clear()
+        self.drawn_until = [-np.inf]*self.N
+
+    def get_trajectory(self, i):
+        return self.trajectories[i].view()
+
+    def draw_incremental(self, screen, i):
+        trajectory = self.get_trajectory(i)
+        t_last = trajectory[-1, 0]
+
+        # Going back in time (reset, seek, replay) leaves nothing on the layer that is still valid.
+        if t_last < self.drawn_until[i]:
+            self.layers[i].clear()
+            self.drawn_until[i] = -np.inf
+
+        if self.drawn_until[i] > -np.inf:
+            self.layers[i].fade(t_last - self.drawn_until[i])
+
+        # The last already-drawn sample is included so the new segments join up with the old ones.
+        start = max(np.searchsorted(trajectory[:, 0], self.drawn_until[i], side="right") - 1, 0)
+        self.layers[i].draw_path(decimate_path(trajectory[start:, 1:]), self.trajectory_colors[i], self.trajectory_thicknesses[i])
+        self.drawn_until[i] = t_last
+        self.layers[i].blit(screen)
 
     def draw(self, screen):
+        import pygame
+
         for i in range(self.N):
-            if len(self.trajectories[i]) < 2:
+            if len(self.trajectories[i]) < 2 or self.max_time_spans[i] <= 0:
+                continue
+
+            if self.incremental:
+                self.draw_incremental(screen, i)
+                continue
+
+            points = decimate_path(self.get_trajectory(i)[:, 1:])
+            if len(points) < 2:
                 continue
 
             pygame.draw.lines(
                 screen,
                 self.trajectory_colors[i],
                 False,
-                [self.trajectories[i][j][1] for j in range(len(self.trajectories[i]))],
+                points,
                 self.trajectory_thicknesses[i]
-            )
\ No newline at end of file
+            )